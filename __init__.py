@@ -5,6 +5,18 @@ from trytond.pool import Pool
 from .configuration import *
 from .party import *
 from .training import *
+from .workload import *
+from .session import *
+from .enrollment import *
+from .prerequisite import *
+from .attendance import *
+from .grade import *
+from .certificate import *
+from .worklist import *
+from .changelog import *
+from .archive import *
+from .user import *
+from .update import *
 
 def register():
     Pool.register(
@@ -20,4 +32,21 @@ def register():
         TrainingCourseOfferRel,
         StudentNote, 
         PartyNote,
+        FacultyWorkload,
+        TrainingRoom,
+        TrainingCourseSession,
+        TrainingCourseEnrollment,
+        TrainingCoursePrerequisite,
+        TrainingCoursePrerequisiteClosure,
+        TrainingCourseAttendance,
+        TrainingCourseEvaluation,
+        TrainingCourseScore,
+        TrainingOfferResult,
+        TrainingCertificate,
+        PartyCallWorklist,
+        TrainingChangeLog,
+        StudentNoteArchive,
+        PartyNoteArchive,
+        User,
+        TrainingModuleFingerprint,
         module='training', type_='model')
@@ -0,0 +1,145 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import datetime
+import logging
+
+from sql import Union
+from sql.aggregate import Max
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+
+from .party import _TYPES, _NOTES
+
+__all__ = ['StudentNoteArchive', 'PartyNoteArchive']
+
+logger = logging.getLogger(__name__)
+
+
+class NoteArchiveMixin(object):
+    '''
+    Move the notes older than the configured horizon, or of inactive parents,
+    from the hot note table to the archive table and back on demand
+    '''
+    # The note model, its parent field and the parent model
+    _note_model = None
+    _parent = None
+    _parent_model = None
+
+    type = fields.Selection(_TYPES, 'Type', required=True, readonly=True)
+    note_type = fields.Selection(_NOTES, 'Note', required=True, readonly=True)
+    value = fields.Char('Value', readonly=True)
+    comment = fields.Text('Comment', readonly=True)
+    date = fields.Date('Date', readonly=True, select=True)
+
+    # The id is kept so the restored notes get back their order and the
+    # audit columns so they keep their author and dates
+    _archived_columns = ['id', 'type', 'note_type', 'value', 'comment',
+        'date', 'create_uid', 'create_date', 'write_uid', 'write_date']
+
+    @classmethod
+    def __setup__(cls):
+        super(NoteArchiveMixin, cls).__setup__()
+        cls._order.insert(0, ('date', 'DESC'))
+        cls._buttons.update({
+                'restore': {},
+                })
+
+    @classmethod
+    def _kept_notes(cls):
+        '''
+        Return the query of the notes that must stay in the hot table
+        '''
+        Note = Pool().get(cls._note_model)
+        note = Note.__table__()
+        parent = getattr(note, cls._parent)
+        # The latest note is displayed on the parent
+        return note.select(Max(note.id), group_by=parent)
+
+    @classmethod
+    def _move(cls, source, target, ids):
+        cursor = Transaction().cursor
+        columns = cls._archived_columns + [cls._parent]
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            cursor.execute(*target.insert(
+                    [getattr(target, c) for c in columns],
+                    source.select(*[getattr(source, c) for c in columns],
+                        where=source.id.in_(sub_ids))))
+            cursor.execute(*source.delete(where=source.id.in_(sub_ids)))
+
+    @classmethod
+    def archive(cls, horizon):
+        '''
+        Move the notes dated before the horizon or belonging to an inactive
+        parent to the archive
+        '''
+        pool = Pool()
+        Note = pool.get(cls._note_model)
+        Parent = pool.get(cls._parent_model)
+        cursor = Transaction().cursor
+        note = Note.__table__()
+        parent = Parent.__table__()
+
+        where = ((note.date < horizon)
+            | getattr(note, cls._parent).in_(parent.select(parent.id,
+                    where=parent.active == False)))
+        cursor.execute(*note.select(note.id,
+                where=where & ~note.id.in_(cls._kept_notes())))
+        ids = [i for i, in cursor.fetchall()]
+        cls._move(note, cls.__table__(), ids)
+        logger.info('%s: %s notes archived', cls._note_model, len(ids))
+        return len(ids)
+
+    @classmethod
+    @ModelView.button
+    def restore(cls, archives):
+        Note = Pool().get(cls._note_model)
+        cls._move(cls.__table__(), Note.__table__(), [a.id for a in archives])
+
+    @classmethod
+    def archive_notes(cls):
+        '''
+        Archive the student and party notes, called by the scheduler
+        '''
+        pool = Pool()
+        Config = pool.get('training.sequences')
+        Date = pool.get('ir.date')
+
+        days = Config(1).note_archive_days
+        if not days:
+            return
+        horizon = Date.today() - datetime.timedelta(days=days)
+        for model in ('student.note.archive', 'party.notes.archive'):
+            pool.get(model).archive(horizon)
+
+
+class StudentNoteArchive(NoteArchiveMixin, ModelSQL, ModelView):
+    'Student Note Archive'
+    __name__ = 'student.note.archive'
+    _note_model = 'student.note'
+    _parent = 'student'
+    _parent_model = 'training.student'
+
+    student = fields.Many2One('training.student', 'Student', readonly=True,
+        ondelete='CASCADE', select=True)
+
+
+class PartyNoteArchive(NoteArchiveMixin, ModelSQL, ModelView):
+    'Party Note Archive'
+    __name__ = 'party.notes.archive'
+    _note_model = 'party.notes'
+    _parent = 'party'
+    _parent_model = 'party.party'
+
+    party = fields.Many2One('party.party', 'Party', readonly=True,
+        ondelete='CASCADE', select=True)
+
+    @classmethod
+    def _kept_notes(cls):
+        Worklist = Pool().get('party.call.worklist')
+        worklist = Worklist.__table__()
+        # The notes of the call worklist are still to be processed
+        return Union(super(PartyNoteArchive, cls)._kept_notes(),
+            worklist.select(worklist.note))
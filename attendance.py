@@ -0,0 +1,263 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from sql.aggregate import Count, Sum
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+
+from .replica import ReplicaError, read_cursor, fall_back
+
+__all__ = ['TrainingCourseAttendance']
+
+# Number of bits set for each byte value
+_POPCOUNT = [bin(i).count('1') for i in range(256)]
+
+
+def popcount(bitmap):
+    'Return the number of sessions marked in the bitmap'
+    return sum(_POPCOUNT[b] for b in bytearray(bitmap or b''))
+
+
+def set_bit(bitmap, index, value):
+    'Return a copy of the bitmap with the bit at index set to value'
+    bitmap = bytearray(bitmap or b'')
+    byte, bit = divmod(index, 8)
+    if byte >= len(bitmap):
+        bitmap.extend(b'\x00' * (byte + 1 - len(bitmap)))
+    if value:
+        bitmap[byte] |= 1 << bit
+    else:
+        bitmap[byte] &= ~(1 << bit) & 0xff
+    return bitmap
+
+
+def get_bit(bitmap, index):
+    'Return True if the bit at index is set'
+    bitmap = bytearray(bitmap or b'')
+    byte, bit = divmod(index, 8)
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << bit))
+
+
+class TrainingCourseAttendance(ModelSQL, ModelView):
+    'Training Course Attendance'
+    __name__ = 'training.course.attendance'
+
+    student = fields.Many2One('training.student', 'Student', required=True,
+        ondelete='CASCADE', select=True)
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True)
+    presence = fields.Binary('Presence', readonly=True,
+        help="One bit per session number, set when the student attended")
+    attended = fields.Integer('Attended Sessions', readonly=True)
+    rate = fields.Function(fields.Float('Attendance Rate', digits=(16, 2)),
+        'get_rate')
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCourseAttendance, cls).__setup__()
+        cls._sql_constraints += [
+            ('student_course_uniq', 'UNIQUE(student, course)',
+                'The attendance of the student is already recorded for this '
+                'course.'),
+            ]
+
+    @staticmethod
+    def default_attended():
+        return 0
+
+    @classmethod
+    def session_counts(cls, course_ids):
+        '''
+        Return the number of sessions per course
+        '''
+        Session = Pool().get('training.course.session')
+        cursor = Transaction().cursor
+        session = Session.__table__()
+
+        course_ids = list(course_ids)
+        counts = dict((c, 0) for c in course_ids)
+        for i in range(0, len(course_ids), cursor.IN_MAX):
+            sub_ids = course_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*session.select(session.course, Count(session.id),
+                    where=session.course.in_(sub_ids),
+                    group_by=session.course))
+            counts.update(cursor.fetchall())
+        return counts
+
+    @classmethod
+    def get_rate(cls, attendances, name):
+        counts = cls.session_counts(set(a.course.id for a in attendances))
+        result = {}
+        for attendance in attendances:
+            total = counts[attendance.course.id]
+            result[attendance.id] = (float(attendance.attended or 0) / total
+                if total else 0.0)
+        return result
+
+    @classmethod
+    def mark(cls, sessions, students, present=True):
+        '''
+        Set the presence of the students for the sessions.
+        Missing attendance records are created and the bitmaps are updated
+        with one UPDATE per record whatever the number of sessions.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        by_course = {}
+        for session in sessions:
+            by_course.setdefault(session.course.id, []).append(
+                session.number - 1)
+        student_ids = [s.id for s in students]
+        presence_field = cls._fields['presence']
+
+        for course_id, bits in by_course.iteritems():
+            attendances = cls.search([
+                    ('course', '=', course_id),
+                    ('student', 'in', student_ids),
+                    ])
+            missing = set(student_ids) - set(a.student.id
+                for a in attendances)
+            if missing:
+                attendances += cls.create([{
+                            'course': course_id,
+                            'student': s,
+                            } for s in missing])
+            for attendance in attendances:
+                bitmap = attendance.presence
+                for bit in bits:
+                    bitmap = set_bit(bitmap, bit, present)
+                cursor.execute(*table.update(
+                        [table.presence, table.attended],
+                        [presence_field.sql_format(buffer(bitmap)),
+                            popcount(bitmap)],
+                        where=table.id == attendance.id))
+
+    @classmethod
+    def clear_sessions(cls, numbers):
+        '''
+        Clear the bits of the session numbers by course in the bitmaps and
+        recount the attended sessions
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        presence_field = cls._fields['presence']
+
+        for course_id, session_numbers in numbers.iteritems():
+            cursor.execute(*table.select(table.id, table.presence,
+                    where=table.course == course_id))
+            for id_, presence in cursor.fetchall():
+                bitmap = presence
+                for number in session_numbers:
+                    bitmap = set_bit(bitmap, number - 1, False)
+                cursor.execute(*table.update(
+                        [table.presence, table.attended],
+                        [presence_field.sql_format(buffer(bitmap)),
+                            popcount(bitmap)],
+                        where=table.id == id_))
+
+    @classmethod
+    def recount(cls, student_ids):
+        '''
+        Recompute the attended sessions of the students from the bitmaps
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        student_ids = list(student_ids)
+        for i in range(0, len(student_ids), cursor.IN_MAX):
+            sub_ids = student_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*table.select(table.id, table.presence,
+                    table.attended,
+                    where=table.student.in_(sub_ids)))
+            for id_, presence, attended in cursor.fetchall():
+                count = popcount(presence)
+                if count != attended:
+                    cursor.execute(*table.update([table.attended], [count],
+                            where=table.id == id_))
+
+    def attended_session(self, session):
+        'Return True if the student attended the session'
+        return get_bit(self.presence, session.number - 1)
+
+    @classmethod
+    def course_rates(cls, courses):
+        '''
+        Return the attendance rate of each course over all its students
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        counts = cls.session_counts([c.id for c in courses])
+        course_ids = list(counts)
+        result = dict((c, 0.0) for c in course_ids)
+        with read_cursor() as read:
+            for i in range(0, len(course_ids), cursor.IN_MAX):
+                sub_ids = course_ids[i:i + cursor.IN_MAX]
+                query = table.select(table.course,
+                    Sum(table.attended), Count(table.id),
+                    where=table.course.in_(sub_ids),
+                    group_by=table.course)
+                try:
+                    read.execute(*query)
+                    rows = read.fetchall()
+                except ReplicaError:
+                    read = fall_back(read)
+                    read.execute(*query)
+                    rows = read.fetchall()
+                for course_id, attended, students in rows:
+                    total = counts[course_id] * students
+                    if total:
+                        result[course_id] = float(attended or 0) / total
+        return result
+
+    @classmethod
+    def offer_rates(cls, offer):
+        '''
+        Return the attendance rate of each student over the courses of the
+        offer
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        counts = cls.session_counts([c.id for c in offer.courses])
+        course_ids = list(counts)
+        attended, total = {}, {}
+        with read_cursor() as read:
+            for i in range(0, len(course_ids), cursor.IN_MAX):
+                sub_ids = course_ids[i:i + cursor.IN_MAX]
+                query = table.select(table.student, table.course,
+                    table.attended,
+                    where=table.course.in_(sub_ids))
+                try:
+                    read.execute(*query)
+                    rows = read.fetchall()
+                except ReplicaError:
+                    read = fall_back(read)
+                    read.execute(*query)
+                    rows = read.fetchall()
+                for student_id, course_id, count in rows:
+                    attended[student_id] = (attended.get(student_id, 0)
+                        + count)
+                    total[student_id] = (total.get(student_id, 0)
+                        + counts[course_id])
+        return dict((s, float(attended[s]) / total[s] if total[s] else 0.0)
+            for s in attended)
+
+    @classmethod
+    def eligible_students(cls, course, minimum):
+        '''
+        Return the ids of the students whose attendance rate of the course
+        reaches the minimum
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        total = cls.session_counts([course.id])[course.id]
+        if not total:
+            return []
+        cursor.execute(*table.select(table.student,
+                where=(table.course == course.id)
+                & (table.attended >= minimum * total)))
+        return [s for s, in cursor.fetchall()]
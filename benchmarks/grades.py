@@ -0,0 +1,55 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+'''
+Benchmark the result computation of an offer of 10000 students.
+
+    python benchmarks/grades.py [students] [courses] [evaluations]
+'''
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        '..'))
+from grading import build_matrix, compute_grades, compute_averages
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    sys.stdout.write('%-30s %8.3f s\n' % (label, time.time() - start))
+    return result
+
+
+def main(students=10000, courses=10, evaluations=5):
+    random.seed(0)
+    student_ids = list(range(1, students + 1))
+    course_ids = list(range(1, courses + 1))
+    evaluation_ids = list(range(1, evaluations + 1))
+    weights = [random.randint(1, 4) for _ in evaluation_ids]
+
+    start = time.time()
+    grades = []
+    for course_id in course_ids:
+        rows = [(s, e, random.uniform(0, 100))
+            for s in student_ids for e in evaluation_ids
+            if random.random() > 0.02]
+        matrix = timed('course %s matrix' % course_id, build_matrix, rows,
+            student_ids, evaluation_ids)
+        grades.append(timed('course %s grades' % course_id, compute_grades,
+                matrix, weights, 60))
+    course_grades = build_matrix(
+        [(s, c, g) for c, (values, _) in zip(course_ids, grades)
+            for s, g in zip(student_ids, values)],
+        student_ids, course_ids)
+    passed = course_grades >= 60
+    averages, ok = timed('offer averages', compute_averages, course_grades,
+        [random.randint(2, 40) for _ in course_ids], passed)
+    sys.stdout.write('%d students, %d courses, %d evaluations: %.3f s, '
+        '%d passed\n' % (students, courses, evaluations,
+            time.time() - start, ok.sum()))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
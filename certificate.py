@@ -0,0 +1,353 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import itertools
+import os
+import sys
+import time
+import logging
+import multiprocessing
+from argparse import ArgumentParser
+
+from sql import Null
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pyson import Eval
+from trytond.transaction import Transaction
+from trytond.config import CONFIG
+from trytond.pool import Pool
+
+__all__ = ['TrainingCertificate']
+
+logger = logging.getLogger(__name__)
+
+_STATES = [
+    ('pending', 'Pending'),
+    ('done', 'Done'),
+    ('error', 'Error'),
+    ]
+
+
+def _pdf_escape(text):
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', 'replace')
+
+
+def pdf_document(lines):
+    '''
+    Return a one page PDF with the lines centered on an A4 landscape page
+    '''
+    content = [b'BT']
+    y = 420
+    for size, text in lines:
+        content.append(b'/F1 ' + str(size).encode('ascii') + b' Tf')
+        x = max(40, int(421 - len(text) * size * 0.25))
+        content.append(('1 0 0 1 %d %d Tm' % (x, y)).encode('ascii'))
+        content.append(b'(' + _pdf_escape(text) + b') Tj')
+        y -= size * 2
+    content.append(b'ET')
+    stream = b'\n'.join(content)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+        b'/Encoding /WinAnsiEncoding >>',
+        b'<< /Length ' + str(len(stream)).encode('ascii') + b' >>\n'
+        b'stream\n' + stream + b'\nendstream',
+        ]
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += str(i).encode('ascii') + b' 0 obj\n' + obj + b'\nendobj\n'
+    xref = len(data)
+    data += ('xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        ).encode('ascii')
+    for offset in offsets:
+        data += ('%010d 00000 n \n' % offset).encode('ascii')
+    data += ('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (len(objects) + 1, xref)).encode('ascii')
+    return data
+
+
+def render_certificate(values):
+    '''
+    Write the certificate of the prefetched values and return its id with
+    the path or the error.
+    It runs in the worker processes so it must not use the database.
+    '''
+    try:
+        lines = [
+            (28, 'Certificate'),
+            (14, 'awarded to'),
+            (22, values['student']),
+            (14, 'for completing'),
+            (20, values['subject']),
+            ]
+        if values.get('grade') is not None:
+            lines.append((14, 'with a grade of %.2f' % values['grade']))
+        if values.get('faculty'):
+            lines.append((12, values['faculty']))
+        lines.append((12, values['date']))
+        path = os.path.join(values['directory'], '%s.pdf' % values['id'])
+        with open(path, 'wb') as fp:
+            fp.write(pdf_document(lines))
+        return values['id'], path, None
+    except Exception as exception:
+        return values['id'], None, str(exception)
+
+
+class TrainingCertificate(ModelSQL, ModelView):
+    'Training Certificate'
+    __name__ = 'training.certificate'
+
+    student = fields.Many2One('training.student', 'Student', required=True,
+        readonly=True, ondelete='CASCADE', select=True)
+    course = fields.Many2One('training.course', 'Course', readonly=True,
+        ondelete='CASCADE', select=True)
+    offer = fields.Many2One('training.offer', 'Offer', readonly=True,
+        ondelete='CASCADE', select=True)
+    grade = fields.Float('Grade', digits=(16, 2), readonly=True)
+    date = fields.Date('Date', readonly=True)
+    state = fields.Selection(_STATES, 'State', required=True, readonly=True,
+        select=True)
+    path = fields.Function(fields.Char('Path'), 'get_path')
+    error = fields.Char('Error', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCertificate, cls).__setup__()
+        cls._order.insert(0, ('date', 'DESC'))
+        cls._buttons.update({
+                'generate': {
+                    'invisible': Eval('state') == 'pending',
+                    },
+                })
+
+    @staticmethod
+    def default_state():
+        return 'pending'
+
+    @staticmethod
+    def default_date():
+        Date_ = Pool().get('ir.date')
+        return Date_.today()
+
+    def get_path(self, name):
+        if self.state == 'done':
+            return os.path.join(self.directory(), '%s.pdf' % self.id)
+
+    @classmethod
+    def create_for_courses(cls, courses):
+        '''
+        Queue the certificates of the students who passed the courses
+        '''
+        Enrollment = Pool().get('training.course.enrollment')
+        enrollments = Enrollment.search([
+                ('course', 'in', [c.id for c in courses]),
+                ('state', '=', 'done'),
+                ])
+        return cls.create([{
+                    'student': e.student.id,
+                    'course': e.course.id,
+                    'grade': e.grade,
+                    } for e in enrollments])
+
+    @classmethod
+    def create_for_offers(cls, offers):
+        '''
+        Queue the certificates of the students who passed the offers
+        '''
+        Result = Pool().get('training.offer.result')
+        results = Result.search([
+                ('offer', 'in', [o.id for o in offers]),
+                ('passed', '=', True),
+                ])
+        return cls.create([{
+                    'student': r.student.id,
+                    'offer': r.offer.id,
+                    'grade': r.grade,
+                    } for r in results])
+
+    @classmethod
+    def directory(cls):
+        'Return the directory where the certificates are stored'
+        directory = os.path.join(CONFIG['data_path'],
+            Transaction().cursor.database_name, 'training_certificates')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    @classmethod
+    def _prefetch(cls, ids):
+        '''
+        Return the values needed to render the certificates, read with one
+        query per chunk of ids
+        '''
+        pool = Pool()
+        Student = pool.get('training.student')
+        Faculty = pool.get('training.faculty')
+        Course = pool.get('training.course')
+        Offer = pool.get('training.offer')
+        Party = pool.get('party.party')
+        Template = pool.get('product.template')
+        cursor = Transaction().cursor
+        certificate = cls.__table__()
+        student = Student.__table__()
+        student_party = Party.__table__()
+        course = Course.__table__()
+        faculty = Faculty.__table__()
+        faculty_party = Party.__table__()
+        offer = Offer.__table__()
+        template = Template.__table__()
+
+        query = certificate.join(student,
+            condition=certificate.student == student.id
+            ).join(student_party,
+            condition=student.name == student_party.id
+            ).join(course, 'LEFT',
+            condition=certificate.course == course.id
+            ).join(faculty, 'LEFT',
+            condition=course.faculty == faculty.id
+            ).join(faculty_party, 'LEFT',
+            condition=faculty.name == faculty_party.id
+            ).join(offer, 'LEFT',
+            condition=certificate.offer == offer.id
+            ).join(template, 'LEFT',
+            condition=offer.name == template.id)
+
+        directory = cls.directory()
+        result = []
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            cursor.execute(*query.select(certificate.id,
+                    student_party.name, student_party.lastname,
+                    course.name, template.name,
+                    faculty_party.name, faculty_party.lastname,
+                    certificate.grade, certificate.date,
+                    where=certificate.id.in_(sub_ids)))
+            for (id_, name, lastname, course_name, offer_name,
+                    faculty_name, faculty_lastname, grade,
+                    date) in cursor.fetchall():
+                result.append({
+                        'id': id_,
+                        'student': ' '.join(filter(None, [name, lastname])),
+                        'subject': course_name or offer_name or '',
+                        'faculty': ' '.join(filter(None, [faculty_name,
+                                    faculty_lastname])),
+                        'grade': grade,
+                        'date': str(date or ''),
+                        'directory': directory,
+                        })
+        return result
+
+    @classmethod
+    @ModelView.button
+    def generate(cls, certificates):
+        # The rendering may take long, so it is left to the scheduler
+        cls.write(certificates, {
+                'state': 'pending',
+                'error': None,
+                })
+
+    @classmethod
+    def generate_pending(cls, processes=1):
+        '''
+        Render all the pending certificates, called by the scheduler and the
+        command line.
+        The scheduler runs in a thread of the server which must not fork, so
+        the certificates are rendered in the process unless the number of
+        processes is given.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        cursor.execute(*table.select(table.id,
+                where=table.state == 'pending'))
+        cls.render([i for i, in cursor.fetchall()], processes=processes)
+
+    @classmethod
+    def render(cls, ids, processes=None):
+        '''
+        Render the certificates in a pool of processes and store the result,
+        in the current process if processes is 1
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        if not ids:
+            return
+        start = time.time()
+        values = cls._prefetch(ids)
+        logger.info('prefetched %s certificates in %.2fs', len(values),
+            time.time() - start)
+
+        processes = processes or int(CONFIG.get(
+                'training_certificate_processes')
+            or multiprocessing.cpu_count())
+        if processes == 1:
+            pool = None
+            results = itertools.imap(render_certificate, values)
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(render_certificate, values,
+                max(1, len(values) // (processes * 4)))
+        done, errors = [], []
+        try:
+            for i, (id_, path, error) in enumerate(results, 1):
+                if error:
+                    errors.append((id_, error))
+                else:
+                    done.append(id_)
+                if i % 1000 == 0 or i == len(values):
+                    elapsed = time.time() - start
+                    logger.info('rendered %s/%s certificates, %.1f/s', i,
+                        len(values), i / elapsed if elapsed else 0)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        for i in range(0, len(done), cursor.IN_MAX):
+            sub_ids = done[i:i + cursor.IN_MAX]
+            cursor.execute(*table.update([table.state, table.error],
+                    ['done', Null], where=table.id.in_(sub_ids)))
+        for id_, error in errors:
+            cursor.execute(*table.update([table.state, table.error],
+                    ['error', error[:255]],
+                    where=table.id == id_))
+        elapsed = time.time() - start
+        logger.info('%s certificates done, %s errors in %.2fs (%.1f/s)',
+            len(done), len(errors), elapsed,
+            len(values) / elapsed if elapsed else 0)
+
+
+def main(argv=None):
+    '''
+    Render the pending certificates of a database out of the server:
+
+        python -m trytond.modules.training.certificate -c trytond.conf -d db
+    '''
+    parser = ArgumentParser(
+        description='Render the pending training certificates')
+    parser.add_argument('-c', '--config', dest='config',
+        help='the trytond configuration file')
+    parser.add_argument('-d', '--database', dest='database', required=True)
+    parser.add_argument('-p', '--processes', dest='processes', type=int,
+        help='the number of workers, training_certificate_processes or '
+        'the number of CPU by default')
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s')
+    CONFIG.update_etc(options.config)
+    Pool.start()
+    with Transaction().start(options.database, 0):
+        Pool(options.database).init()
+        Pool().get('training.certificate').generate_pending(
+            processes=options.processes)
+        Transaction().cursor.commit()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from sql.conditionals import Coalesce
+from sql.functions import Function, CurrentTimestamp
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond.config import CONFIG
+from trytond.rpc import RPC
+
+__all__ = ['ChangeLogMixin', 'TrainingChangeLog']
+
+_ACTIONS = [
+    ('create', 'Create'),
+    ('write', 'Write'),
+    ('delete', 'Delete'),
+    ('transition', 'Transition'),
+    ]
+
+
+class TxidCurrent(Function):
+    __slots__ = ()
+    _function = 'TXID_CURRENT'
+
+
+class ChangeLogMixin(object):
+    '''
+    Append every create, write, delete and workflow transition of the model
+    to the training change log, in the same transaction
+    '''
+
+    @classmethod
+    def create(cls, vlist):
+        ChangeLog = Pool().get('training.change.log')
+        records = super(ChangeLogMixin, cls).create(vlist)
+        fields_ = set()
+        for values in vlist:
+            fields_.update(values)
+        ChangeLog.log(cls.__name__, [r.id for r in records], 'create',
+            fields_)
+        return records
+
+    @classmethod
+    def write(cls, records, vals):
+        ChangeLog = Pool().get('training.change.log')
+        result = super(ChangeLogMixin, cls).write(records, vals)
+        # The workflow transitions only write the state
+        if set(vals) == set(['state']):
+            ChangeLog.log(cls.__name__, [r.id for r in records],
+                'transition', vals, state=vals['state'])
+        else:
+            ChangeLog.log(cls.__name__, [r.id for r in records], 'write',
+                vals)
+        return result
+
+    @classmethod
+    def delete(cls, records):
+        ChangeLog = Pool().get('training.change.log')
+        ChangeLog.log(cls.__name__, [r.id for r in records], 'delete')
+        super(ChangeLogMixin, cls).delete(records)
+
+
+class TrainingChangeLog(ModelSQL, ModelView):
+    'Training Change Log'
+    __name__ = 'training.change.log'
+
+    model = fields.Char('Model', required=True, readonly=True, select=True)
+    record = fields.Integer('Record', required=True, readonly=True,
+        select=True)
+    action = fields.Selection(_ACTIONS, 'Action', required=True,
+        readonly=True)
+    changed_fields = fields.Char('Changed Fields', readonly=True,
+        help="The comma separated names of the fields written")
+    state = fields.Char('State', readonly=True,
+        help="The new state of a workflow transition")
+    transaction_id = fields.BigInteger('Transaction', readonly=True,
+        select=True, help="The database transaction of the change")
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingChangeLog, cls).__setup__()
+        cls._order.insert(0, ('id', 'DESC'))
+        cls.__rpc__.update({
+                'changes_since': RPC(),
+                })
+
+    @classmethod
+    def log(cls, model, ids, action, field_names=None, state=None):
+        '''
+        Append one entry per record with the id of the database transaction,
+        which orders the entries for the consumers
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        if not ids:
+            return
+        field_names = sorted(field_names or [])
+        changed = ','.join(field_names) or None
+        # SQLite serializes the transactions so the ids are in commit order
+        transaction_id = (TxidCurrent() if CONFIG['db_type'] == 'postgresql'
+            else None)
+        user = Transaction().user
+
+        for i in range(0, len(ids), cursor.IN_MAX):
+            cursor.execute(*table.insert(
+                    [table.model, table.record, table.action,
+                        table.changed_fields, table.state,
+                        table.transaction_id, table.create_uid,
+                        table.create_date],
+                    [[model, id_, action, changed, state, transaction_id,
+                            user, CurrentTimestamp()]
+                        for id_ in ids[i:i + cursor.IN_MAX]]))
+
+    @classmethod
+    def changes_since(cls, sequence, limit=1000, models=None):
+        '''
+        Return the entries after the sequence number in order and the
+        sequence number to use for the next call.
+        The entries are ordered by transaction then id and only those of the
+        transactions older than every running transaction are returned, so
+        an entry committed later can not be ordered before the sequence.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        transaction_id = Coalesce(table.transaction_id, 0)
+
+        last_transaction = 0
+        if sequence:
+            cursor.execute(*table.select(transaction_id,
+                    where=table.id == sequence))
+            row = cursor.fetchone()
+            if row:
+                last_transaction = row[0]
+        where = ((transaction_id > last_transaction)
+            | ((transaction_id == last_transaction)
+                & (table.id > sequence)))
+        if CONFIG['db_type'] == 'postgresql':
+            cursor.execute('SELECT '
+                'txid_snapshot_xmin(txid_current_snapshot())')
+            xmin, = cursor.fetchone()
+            where &= transaction_id < xmin
+        if models:
+            where &= table.model.in_(list(models))
+        cursor.execute(*table.select(table.id, table.model, table.record,
+                table.action, table.changed_fields, table.state,
+                table.create_date,
+                where=where, order_by=[transaction_id.asc, table.id.asc],
+                limit=limit))
+        changes = []
+        for (id_, model, record, action, changed, state,
+                date) in cursor.fetchall():
+            changes.append({
+                    'sequence': id_,
+                    'model': model,
+                    'id': record,
+                    'action': action,
+                    'fields': changed.split(',') if changed else [],
+                    'state': state,
+                    'date': date,
+                    })
+            sequence = id_
+        return changes, sequence
@@ -32,4 +32,11 @@ class TrainingSequences(ModelSingleton, ModelSQL, ModelView):
         domain=[('code', '=', 'training.course')]))
     offer_sequence = fields.Property(fields.Many2One(
         'ir.sequence', 'Offer Sequence', required=True,
-        domain=[('code', '=', 'training.offer')]))
\ No newline at end of file
+        domain=[('code', '=', 'training.offer')]))
+    note_archive_days = fields.Integer('Note Archive Days',
+        help="The notes older than this number of days are moved to the "
+        "archive. Leave empty to keep all the notes")
+
+    @staticmethod
+    def default_note_archive_days():
+        return 365
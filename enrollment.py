@@ -0,0 +1,73 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pool import Pool
+
+__all__ = ['TrainingCourseEnrollment']
+
+_ENROLLMENT_STATES = [
+    ('enrolled', 'Enrolled'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+    ('cancel', 'Canceled'),
+    ]
+
+
+class TrainingCourseEnrollment(ModelSQL, ModelView):
+    'Training Course Enrollment'
+    __name__ = 'training.course.enrollment'
+
+    student = fields.Many2One('training.student', 'Student', required=True,
+        ondelete='CASCADE', select=True)
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True)
+    offer = fields.Many2One('training.offer', 'Offer', select=True,
+        help="The offer the student is enrolled through")
+    state = fields.Selection(_ENROLLMENT_STATES, 'State', required=True,
+        select=True)
+    grade = fields.Float('Grade', digits=(16, 2), readonly=True,
+        help="The final grade computed when the course is done")
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCourseEnrollment, cls).__setup__()
+        cls._sql_constraints += [
+            ('student_course_uniq', 'UNIQUE(student, course)',
+                'The student is already enrolled in this course.'),
+            ]
+        cls._error_messages.update({
+                'not_eligible': ('The student "%s" has not completed the '
+                    'prerequisites of course "%s".'),
+                })
+
+    @staticmethod
+    def default_state():
+        return 'enrolled'
+
+    @classmethod
+    def validate(cls, enrollments):
+        super(TrainingCourseEnrollment, cls).validate(enrollments)
+        cls.check_eligibility(enrollments)
+
+    @classmethod
+    def check_eligibility(cls, enrollments):
+        '''
+        Check the prerequisites of the new enrollments, one query per course
+        '''
+        Course = Pool().get('training.course')
+
+        by_course = {}
+        for enrollment in enrollments:
+            if enrollment.state != 'enrolled':
+                continue
+            by_course.setdefault(enrollment.course, []).append(
+                enrollment.student)
+        for course, students in by_course.iteritems():
+            eligibility = Course.get_eligibility(course, students)
+            for student in students:
+                if not eligibility[student.id]:
+                    cls.raise_user_error('not_eligible',
+                        (student.rec_name, course.rec_name))
+
+    def get_rec_name(self, name):
+        return '%s - %s' % (self.student.rec_name, self.course.rec_name)
@@ -0,0 +1,175 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from sql import Null
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+
+from .grading import build_matrix, compute_grades, compute_averages
+
+__all__ = ['TrainingCourseEvaluation', 'TrainingCourseScore',
+    'TrainingOfferResult']
+
+
+def _update_grouped(table, rows, columns):
+    '''
+    Write the (id, values) rows with one UPDATE per distinct values
+    '''
+    cursor = Transaction().cursor
+    groups = {}
+    for id_, values in rows:
+        groups.setdefault(values, []).append(id_)
+    for values, ids in groups.iteritems():
+        for i in range(0, len(ids), cursor.IN_MAX):
+            sub_ids = ids[i:i + cursor.IN_MAX]
+            cursor.execute(*table.update(columns, list(values),
+                    where=table.id.in_(sub_ids)))
+
+
+class TrainingCourseEvaluation(ModelSQL, ModelView):
+    'Training Course Evaluation'
+    __name__ = 'training.course.evaluation'
+
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True)
+    name = fields.Char('Name', required=True)
+    weight = fields.Float('Weight', required=True,
+        help="The weight of the evaluation in the final grade")
+    scores = fields.One2Many('training.course.score', 'evaluation', 'Scores')
+
+    @staticmethod
+    def default_weight():
+        return 1.0
+
+    @classmethod
+    def compute_results(cls, courses):
+        '''
+        Compute the final grade of every enrolled student of the courses and
+        set the enrollments as done or failed.
+        Each course is computed as one matrix of students x evaluations.
+        '''
+        pool = Pool()
+        Score = pool.get('training.course.score')
+        Enrollment = pool.get('training.course.enrollment')
+        cursor = Transaction().cursor
+        score = Score.__table__()
+        evaluation = cls.__table__()
+        enrollment = Enrollment.__table__()
+
+        for course in courses:
+            cursor.execute(*enrollment.select(enrollment.id,
+                    enrollment.student,
+                    where=(enrollment.course == course.id)
+                    & (enrollment.state != 'cancel'),
+                    order_by=enrollment.student))
+            enrollments = cursor.fetchall()
+            if not enrollments:
+                continue
+            cursor.execute(*evaluation.select(evaluation.id,
+                    evaluation.weight,
+                    where=evaluation.course == course.id,
+                    order_by=evaluation.id))
+            evaluations = cursor.fetchall()
+            student_ids = [s for _, s in enrollments]
+            evaluation_ids = [e for e, _ in evaluations]
+
+            query = score.join(evaluation,
+                condition=score.evaluation == evaluation.id)
+            cursor.execute(*query.select(score.student, score.evaluation,
+                    score.score,
+                    where=(evaluation.course == course.id)
+                    & (score.score != Null)))
+            student_set = set(student_ids)
+            rows = [r for r in cursor.fetchall() if r[0] in student_set]
+
+            matrix = build_matrix(rows, student_ids, evaluation_ids)
+            grades, passed = compute_grades(matrix,
+                [w for _, w in evaluations], course.pass_grade or 0)
+            _update_grouped(enrollment, [
+                    (id_, (round(float(grade), 2),
+                            'done' if ok else 'failed'))
+                    for (id_, _), grade, ok in zip(enrollments, grades,
+                        passed)],
+                [enrollment.grade, enrollment.state])
+
+
+class TrainingCourseScore(ModelSQL, ModelView):
+    'Training Course Score'
+    __name__ = 'training.course.score'
+
+    evaluation = fields.Many2One('training.course.evaluation', 'Evaluation',
+        required=True, ondelete='CASCADE', select=True)
+    student = fields.Many2One('training.student', 'Student', required=True,
+        ondelete='CASCADE', select=True)
+    score = fields.Float('Score', digits=(16, 2))
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCourseScore, cls).__setup__()
+        cls._sql_constraints += [
+            ('evaluation_student_uniq', 'UNIQUE(evaluation, student)',
+                'The student already has a score for this evaluation.'),
+            ]
+
+
+class TrainingOfferResult(ModelSQL, ModelView):
+    'Training Offer Result'
+    __name__ = 'training.offer.result'
+
+    offer = fields.Many2One('training.offer', 'Offer', required=True,
+        readonly=True, ondelete='CASCADE', select=True)
+    student = fields.Many2One('training.student', 'Student', required=True,
+        readonly=True, ondelete='CASCADE', select=True)
+    grade = fields.Float('Average Grade', digits=(16, 2), readonly=True)
+    passed = fields.Boolean('Passed', readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingOfferResult, cls).__setup__()
+        cls._sql_constraints += [
+            ('offer_student_uniq', 'UNIQUE(offer, student)',
+                'The student already has a result for this offer.'),
+            ]
+
+    @classmethod
+    def compute_results(cls, offers):
+        '''
+        Replace the results of the offers by the average of the course grades
+        weighted by the course durations, as one matrix of students x courses
+        '''
+        pool = Pool()
+        Enrollment = pool.get('training.course.enrollment')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        enrollment = Enrollment.__table__()
+
+        for offer in offers:
+            cursor.execute(*table.delete(where=table.offer == offer.id))
+            courses = list(offer.courses)
+            if not courses:
+                continue
+            course_ids = [c.id for c in courses]
+            cursor.execute(*enrollment.select(enrollment.student,
+                    enrollment.course, enrollment.grade, enrollment.state,
+                    where=(enrollment.offer == offer.id)
+                    & enrollment.course.in_(course_ids)
+                    & enrollment.state.in_(['done', 'failed'])))
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            student_ids = sorted(set(r[0] for r in rows))
+            grades = build_matrix([(s, c, g or 0) for s, c, g, _ in rows],
+                student_ids, course_ids)
+            passed = build_matrix(
+                [(s, c, 1 if state == 'done' else 0)
+                    for s, c, _, state in rows],
+                student_ids, course_ids) == 1
+            averages, ok = compute_averages(grades,
+                [c.duration or 1 for c in courses], passed)
+            values = [[offer.id, s, round(float(a), 2), bool(p)]
+                for s, a, p in zip(student_ids, averages, ok)]
+            for i in range(0, len(values), cursor.IN_MAX):
+                cursor.execute(*table.insert([table.offer, table.student,
+                            table.grade, table.passed],
+                        values[i:i + cursor.IN_MAX]))
@@ -0,0 +1,57 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+'''
+Vectorized computation of the results of a course or an offer.
+This module does not depend on trytond so it can be benchmarked alone.
+'''
+import numpy
+
+
+def build_matrix(rows, row_ids, column_ids):
+    '''
+    Return a matrix of len(row_ids) x len(column_ids) filled with the values
+    of the (row id, column id, value) rows, NaN where there is no value
+    '''
+    matrix = numpy.empty((len(row_ids), len(column_ids)))
+    matrix.fill(numpy.nan)
+    if not rows:
+        return matrix
+    row_index = dict((id_, i) for i, id_ in enumerate(row_ids))
+    column_index = dict((id_, i) for i, id_ in enumerate(column_ids))
+    rows_, columns, values = zip(*rows)
+    matrix[[row_index[r] for r in rows_],
+        [column_index[c] for c in columns]] = numpy.array(values,
+        dtype=float)
+    return matrix
+
+
+def compute_grades(scores, weights, pass_grade):
+    '''
+    Return the weighted grade of each row of scores and whether it reaches
+    the pass grade. Missing scores count as zero.
+    '''
+    scores = numpy.nan_to_num(numpy.asarray(scores, dtype=float))
+    weights = numpy.asarray(weights, dtype=float)
+    total = weights.sum()
+    if not total:
+        grades = numpy.zeros(scores.shape[0])
+    else:
+        grades = scores.dot(weights) / total
+    return grades, grades >= pass_grade
+
+
+def compute_averages(grades, weights, passed):
+    '''
+    Return the weighted average of each row of grades ignoring the missing
+    ones and whether every grade of the row is passed, a missing grade is not
+    passed
+    '''
+    grades = numpy.asarray(grades, dtype=float)
+    present = ~numpy.isnan(grades)
+    weights = numpy.where(present, numpy.asarray(weights, dtype=float), 0)
+    totals = weights.sum(axis=1)
+    sums = (numpy.nan_to_num(grades) * weights).sum(axis=1)
+    averages = numpy.where(totals > 0, sums / numpy.where(totals > 0,
+            totals, 1), 0)
+    passed = numpy.asarray(passed, dtype=bool) & present
+    return averages, passed.all(axis=1)
@@ -13,13 +13,18 @@
 #
 ##############################################################################
 from dateutil.relativedelta import relativedelta
+from sql import Null
 from datetime import datetime, timedelta, date
 from trytond.model import ModelView, ModelSQL, fields
 from trytond.wizard import Wizard, StateAction, StateView, Button
 from trytond.transaction import Transaction
+from trytond.cache import Cache
 from trytond.pyson import Eval, Not, Bool, PYSONEncoder, Equal
 from trytond.pool import Pool
 
+from .changelog import ChangeLogMixin
+from .replica import ReplicaMixin
+
 __all__ = ['PartyAddress', 'Party',
            'StudentData', 'FacultyData',
            'StudentNote',
@@ -55,7 +60,7 @@ class PartyAddress(ModelSQL, ModelView):
         ' brother,...')
     relative_id = fields.Many2One(
         'party.party', 'Contact', domain=[('is_person', '=', True)],
-        help='Include link to the relative')
+        select=True, help='Include link to the relative')
 
     is_school = fields.Boolean(
         "School", help="Check this box to mark the school address")
@@ -63,7 +68,7 @@ class PartyAddress(ModelSQL, ModelView):
         "Work", help="Check this box to mark the work address")
 
 
-class Party(ModelSQL, ModelView):
+class Party(ChangeLogMixin, ModelSQL, ModelView):
     'Party'
     __name__ = 'party.party'
 
@@ -132,9 +137,22 @@ class Party(ModelSQL, ModelView):
             })
     
     notes = fields.One2Many('party.notes', 'party', 'Notes')
+    archived_notes = fields.One2Many('party.notes.archive', 'party',
+        'Archived Notes', readonly=True)
     
     last_note = fields.Function(fields.Char('Last Note'), 'get_last_note')
 
+    listed_in = fields.One2Many('party.address', 'relative_id',
+        'Listed in Addresses', readonly=True,
+        help='The addresses of other parties that list this party as contact')
+    contacts = fields.Function(fields.Many2Many('party.party', None, None,
+            'Contacts', help='The parties listed as contact in the addresses'),
+        'get_contacts')
+    listed_by = fields.Function(fields.Many2Many('party.party', None, None,
+            'Listed as Contact by',
+            help='The parties that list this party as contact'),
+        'get_contacts')
+
     @classmethod
     def write(cls, parties, vals):
         # We use this method overwrite to make the fields that have a unique
@@ -143,6 +161,8 @@ class Party(ModelSQL, ModelView):
 
         if vals.get('ref') == '':
             vals['ref'] = None
+        if 'internal_user' in vals:
+            Pool().get('training.faculty').clear_user_faculty_cache()
         return super(Party, cls).write(parties, vals)
 
     @classmethod
@@ -155,6 +175,8 @@ class Party(ModelSQL, ModelView):
         for values in vlist:
             if 'ref' in values and not values['ref']:
                 values['ref'] = None
+        if any(v.get('internal_user') for v in vlist):
+            Pool().get('training.faculty').clear_user_faculty_cache()
 
         return super(Party, cls).create(vlist)
 
@@ -225,6 +247,47 @@ class Party(ModelSQL, ModelView):
         return 3
     
     
+    @classmethod
+    def get_contact_graph(cls, parties):
+        '''
+        Return for each party the list of (party id, relationship, direction)
+        linked through the address contacts, direction being 'contact' when
+        the party lists the other and 'listed_by' otherwise.
+        Both directions are read with one query per chunk of parties.
+        '''
+        pool = Pool()
+        Address = pool.get('party.address')
+        cursor = Transaction().cursor
+        address = Address.__table__()
+
+        party_ids = list(set(p.id for p in parties))
+        graph = dict((i, []) for i in party_ids)
+        for i in range(0, len(party_ids), cursor.IN_MAX):
+            sub_ids = party_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*address.select(address.party,
+                    address.relative_id, address.relationship,
+                    where=(address.party.in_(sub_ids)
+                        | address.relative_id.in_(sub_ids))
+                    & (address.relative_id != Null)))
+            for party, relative, relationship in cursor.fetchall():
+                if party in graph:
+                    graph[party].append((relative, relationship, 'contact'))
+                if relative in graph:
+                    graph[relative].append((party, relationship,
+                            'listed_by'))
+        return graph
+
+    @classmethod
+    def get_contacts(cls, parties, names):
+        graph = cls.get_contact_graph(parties)
+        result = dict((n, dict((p.id, []) for p in parties)) for n in names)
+        for party_id, links in graph.iteritems():
+            for other, _, direction in links:
+                name = 'contacts' if direction == 'contact' else 'listed_by'
+                if name in result and other not in result[name][party_id]:
+                    result[name][party_id].append(other)
+        return result
+
     def get_last_note(self, name=None):
         if self.notes:
             if self.notes[0].note_type != None and self.notes[0].value  != None:
@@ -233,7 +296,7 @@ class Party(ModelSQL, ModelView):
                 return ''
             
 # STUDENT GENERAL INFORMATION
-class StudentData(ModelSQL, ModelView):
+class StudentData(ChangeLogMixin, ReplicaMixin, ModelSQL, ModelView):
     'Student related information'
     __name__ = 'training.student'
 
@@ -289,6 +352,10 @@ class StudentData(ModelSQL, ModelView):
     
     notes = fields.One2Many('student.note','student',
                             'Notes')
+    archived_notes = fields.One2Many('student.note.archive', 'student',
+        'Archived Notes', readonly=True)
+    enrollments = fields.One2Many('training.course.enrollment', 'student',
+        'Enrollments')
 
     photo = fields.Function(fields.Binary('Picture'), 'get_student_photo')
 
@@ -402,6 +469,15 @@ class StudentData(ModelSQL, ModelView):
         else:
             return self.name.name
 
+    @classmethod
+    def get_emergency_contacts(cls, students):
+        '''
+        Return for each student the contact graph of its party
+        '''
+        Party = Pool().get('party.party')
+        graph = Party.get_contact_graph([s.name for s in students])
+        return dict((s.id, graph[s.name.id]) for s in students)
+
     # Search by the patient name, lastname or SSN
     @classmethod
     def search_rec_name(cls, name, clause):
@@ -415,7 +491,7 @@ class StudentData(ModelSQL, ModelView):
         return [(cls._rec_name,) + tuple(clause[1:])]
     
 # STUDENT GENERAL INFORMATION
-class FacultyData(ModelSQL, ModelView):
+class FacultyData(ReplicaMixin, ModelSQL, ModelView):
     'Faculty related information'
     __name__ = 'training.faculty'
 
@@ -508,6 +584,10 @@ class FacultyData(ModelSQL, ModelView):
         ('-', '-'),
         ], 'Rh')
 
+    # The faculty of each user, used by the access rules of every request
+    _user_faculty_cache = Cache('training_faculty.user_faculty',
+        context=False)
+
     @classmethod
     def __setup__(cls):
         super(FacultyData, cls).__setup__()
@@ -553,7 +633,52 @@ class FacultyData(ModelSQL, ModelView):
                 values['identification_code'] = Sequence.get_id(
                     config.faculty_sequence.id)
 
-        return super(StudentData, cls).create(vlist)
+        cls.clear_user_faculty_cache()
+        return super(FacultyData, cls).create(vlist)
+
+    @classmethod
+    def write(cls, faculties, vals):
+        if 'name' in vals or 'active' in vals:
+            cls.clear_user_faculty_cache()
+        return super(FacultyData, cls).write(faculties, vals)
+
+    @classmethod
+    def delete(cls, faculties):
+        cls.clear_user_faculty_cache()
+        super(FacultyData, cls).delete(faculties)
+
+    @classmethod
+    def clear_user_faculty_cache(cls):
+        '''
+        Clear the faculty of the users and the rule domains evaluated with it
+        '''
+        cls._user_faculty_cache.clear()
+        Pool().get('ir.rule')._domain_get_cache.clear()
+
+    @classmethod
+    def user_faculty(cls, user_id):
+        '''
+        Return the id of the active faculty whose party has the user as
+        internal user, or None
+        '''
+        faculty_id = cls._user_faculty_cache.get(user_id, -1)
+        if faculty_id != -1:
+            return faculty_id
+
+        Party = Pool().get('party.party')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        party = Party.__table__()
+
+        cursor.execute(*table.join(party,
+                condition=table.name == party.id
+                ).select(table.id,
+                where=(party.internal_user == user_id)
+                & (table.active == True)))
+        row = cursor.fetchone()
+        faculty_id = row[0] if row else None
+        cls._user_faculty_cache.set(user_id, faculty_id)
+        return faculty_id
 
     def get_rec_name(self, name):
         if self.name.lastname:
@@ -589,6 +714,29 @@ class PartyNote(ModelSQL, ModelView):
         super(PartyNote, cls).__setup__()
         cls._order.insert(0, ('id', 'DESC'))
 
+    @classmethod
+    def create(cls, vlist):
+        Worklist = Pool().get('party.call.worklist')
+        notes = super(PartyNote, cls).create(vlist)
+        Worklist.refresh([n.party.id for n in notes if n.party])
+        return notes
+
+    @classmethod
+    def write(cls, notes, vals):
+        Worklist = Pool().get('party.call.worklist')
+        parties = [n.party.id for n in notes if n.party]
+        result = super(PartyNote, cls).write(notes, vals)
+        parties += [n.party.id for n in notes if n.party]
+        Worklist.refresh(parties)
+        return result
+
+    @classmethod
+    def delete(cls, notes):
+        Worklist = Pool().get('party.call.worklist')
+        parties = [n.party.id for n in notes if n.party]
+        super(PartyNote, cls).delete(notes)
+        Worklist.refresh(parties)
+
     @staticmethod
     def default_type():
         return 'personal'
@@ -0,0 +1,194 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+
+__all__ = ['TrainingCoursePrerequisite', 'TrainingCoursePrerequisiteClosure']
+
+
+class TrainingCoursePrerequisite(ModelSQL, ModelView):
+    'Training Course Prerequisite'
+    __name__ = 'training.course.prerequisite'
+
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True)
+    prerequisite = fields.Many2One('training.course', 'Prerequisite',
+        required=True, ondelete='CASCADE', select=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCoursePrerequisite, cls).__setup__()
+        cls._sql_constraints += [
+            ('course_prerequisite_uniq', 'UNIQUE(course, prerequisite)',
+                'The prerequisite is already defined for this course.'),
+            ]
+        cls._error_messages.update({
+                'recursive_prerequisites': ('You can not create recursive '
+                    'prerequisites on course "%s".'),
+                })
+
+    @classmethod
+    def lock(cls):
+        '''
+        Serialize the changes of the prerequisites, otherwise two transactions
+        adding opposite edges would both pass the cycle check
+        '''
+        Transaction().cursor.lock(cls._table)
+
+    @classmethod
+    def create(cls, vlist):
+        Closure = Pool().get('training.course.prerequisite.closure')
+
+        cls.lock()
+        prerequisites = super(TrainingCoursePrerequisite, cls).create(vlist)
+        for prerequisite in prerequisites:
+            Closure.add_edge(prerequisite.course.id,
+                prerequisite.prerequisite.id)
+        return prerequisites
+
+    @classmethod
+    def write(cls, prerequisites, vals):
+        Closure = Pool().get('training.course.prerequisite.closure')
+
+        cls.lock()
+        courses = set(p.course.id for p in prerequisites)
+        result = super(TrainingCoursePrerequisite, cls).write(prerequisites,
+            vals)
+        courses.update(p.course.id for p in prerequisites)
+        Closure.refresh(courses)
+        return result
+
+    @classmethod
+    def delete(cls, prerequisites):
+        Closure = Pool().get('training.course.prerequisite.closure')
+
+        cls.lock()
+        courses = set(p.course.id for p in prerequisites)
+        super(TrainingCoursePrerequisite, cls).delete(prerequisites)
+        Closure.refresh(courses)
+
+
+class TrainingCoursePrerequisiteClosure(ModelSQL):
+    'Training Course Prerequisite Closure'
+    __name__ = 'training.course.prerequisite.closure'
+
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True)
+    required = fields.Many2One('training.course', 'Required Course',
+        required=True, ondelete='CASCADE', select=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCoursePrerequisiteClosure, cls).__setup__()
+        cls._sql_constraints += [
+            ('course_required_uniq', 'UNIQUE(course, required)',
+                'The required course is already in the closure.'),
+            ]
+
+    @classmethod
+    def _insert(cls, pairs):
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        pairs = list(pairs)
+        for i in range(0, len(pairs), cursor.IN_MAX):
+            cursor.execute(*table.insert([table.course, table.required],
+                    [list(p) for p in pairs[i:i + cursor.IN_MAX]]))
+
+    @classmethod
+    def _select(cls, table, column, where):
+        cursor = Transaction().cursor
+        cursor.execute(*table.select(column, where=where))
+        return set(r for r, in cursor.fetchall())
+
+    @classmethod
+    def dependents(cls, course_ids):
+        '''
+        Return the ids of the courses that require one of the courses
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        course_ids = list(course_ids)
+        result = set()
+        for i in range(0, len(course_ids), cursor.IN_MAX):
+            sub_ids = course_ids[i:i + cursor.IN_MAX]
+            result |= cls._select(table, table.course,
+                table.required.in_(sub_ids))
+        return result
+
+    @classmethod
+    def add_edge(cls, course_id, prerequisite_id):
+        '''
+        Add the pairs created by the new edge course -> prerequisite:
+        every course requiring course also requires prerequisite and all
+        its requirements.
+        '''
+        Prerequisite = Pool().get('training.course.prerequisite')
+        table = cls.__table__()
+
+        required = cls._select(table, table.required,
+            table.course == prerequisite_id)
+        if course_id == prerequisite_id or course_id in required:
+            Course = Pool().get('training.course')
+            Prerequisite.raise_user_error('recursive_prerequisites',
+                (Course(course_id).rec_name,))
+        required.add(prerequisite_id)
+        dependents = cls.dependents([course_id])
+        dependents.add(course_id)
+
+        cursor = Transaction().cursor
+        dependents = list(dependents)
+        existing = set()
+        for i in range(0, len(dependents), cursor.IN_MAX):
+            sub_ids = dependents[i:i + cursor.IN_MAX]
+            cursor.execute(*table.select(table.course, table.required,
+                    where=table.course.in_(sub_ids)
+                    & table.required.in_(list(required))))
+            existing.update(cursor.fetchall())
+        cls._insert(set((d, r) for d in dependents for r in required)
+            - existing)
+
+    @classmethod
+    def refresh(cls, course_ids, dependents=True):
+        '''
+        Recompute the closure of the courses and, unless dependents is False,
+        of the courses requiring them from the prerequisite edges.
+        '''
+        pool = Pool()
+        Prerequisite = pool.get('training.course.prerequisite')
+        Course = pool.get('training.course')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        edge = Prerequisite.__table__()
+
+        affected = set(course_ids)
+        if dependents:
+            affected |= cls.dependents(course_ids)
+        if not affected:
+            return
+        affected = list(affected)
+        for i in range(0, len(affected), cursor.IN_MAX):
+            sub_ids = affected[i:i + cursor.IN_MAX]
+            cursor.execute(*table.delete(where=table.course.in_(sub_ids)))
+
+        cursor.execute(*edge.select(edge.course, edge.prerequisite))
+        graph = {}
+        for course, prerequisite in cursor.fetchall():
+            graph.setdefault(course, set()).add(prerequisite)
+
+        pairs = []
+        for course in affected:
+            # Same walk as check_recursion but collecting the visited nodes
+            visited = set()
+            todo = list(graph.get(course, ()))
+            while todo:
+                node = todo.pop()
+                if node == course:
+                    Prerequisite.raise_user_error('recursive_prerequisites',
+                        (Course(course).rec_name,))
+                if node in visited:
+                    continue
+                visited.add(node)
+                todo.extend(graph.get(node, ()))
+            pairs.extend((course, r) for r in visited)
+        cls._insert(pairs)
@@ -0,0 +1,241 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+'''
+Recompute the derived training data of a database after a change of the
+business rules.
+The ids of each model are split in chunks processed in parallel by worker
+processes, each chunk in its own transaction. The finished chunks are saved
+in a state file so an interrupted run is resumed where it stopped:
+
+    python -m trytond.modules.training.recompute -c trytond.conf -d db \\
+        [-m training.course] [--chunk-size 500] [-p 4] [--state file]
+'''
+import bisect
+import json
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool as ProcessPool
+
+from trytond.config import CONFIG
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond import backend
+
+__all__ = ['MODELS', 'recompute']
+
+logger = logging.getLogger(__name__)
+
+
+def _recompute_party(ids):
+    pool = Pool()
+    pool.get('party.call.worklist').refresh(ids)
+
+
+def _recompute_student(ids):
+    pool = Pool()
+    pool.get('training.course.attendance').recount(ids)
+
+
+def _recompute_course(ids):
+    pool = Pool()
+    Course = pool.get('training.course')
+    Closure = pool.get('training.course.prerequisite.closure')
+    Evaluation = pool.get('training.course.evaluation')
+
+    # The dependents are in the other chunks
+    Closure.refresh(ids, dependents=False)
+    Evaluation.compute_results([c for c in Course.browse(ids)
+            if c.state == 'done'])
+
+
+def _recompute_offer(ids):
+    pool = Pool()
+    Offer = pool.get('training.offer')
+    Result = pool.get('training.offer.result')
+    Result.compute_results([o for o in Offer.browse(ids)
+            if o.state == 'done'])
+
+
+def _recompute_faculty(ids):
+    pool = Pool()
+    pool.get('training.faculty.workload').rebuild_faculties(ids)
+
+
+# The models with derived data and the function recomputing the data of a
+# chunk of ids. The chunks of a model are processed in parallel but the
+# models one after the other as the offer results read the grades computed
+# by the courses.
+MODELS = [
+    ('party.party', _recompute_party),
+    ('training.student', _recompute_student),
+    ('training.course', _recompute_course),
+    ('training.offer', _recompute_offer),
+    ('training.faculty', _recompute_faculty),
+    ]
+
+
+def _processed(ranges, id_):
+    '''
+    Return True if the id is in one of the sorted (first, last) ranges
+    '''
+    index = bisect.bisect_right(ranges, (id_, sys.maxint)) - 1
+    return index >= 0 and ranges[index][0] <= id_ <= ranges[index][1]
+
+
+def _chunks(database, models, chunk_size, done):
+    '''
+    Return the list of (model, ids) to process, without the ids of the
+    finished ranges
+    '''
+    chunks = []
+    with Transaction().start(database, 0):
+        pool = Pool(database)
+        pool.init()
+        cursor = Transaction().cursor
+        for model in models:
+            ranges = sorted(r for r in done.get(model, []) if r[0] is not None)
+            table = pool.get(model).__table__()
+            cursor.execute(*table.select(table.id, order_by=table.id))
+            ids = [i for i, in cursor.fetchall()
+                if not _processed(ranges, i)]
+            # The courses without faculty
+            if (model == 'training.faculty'
+                    and (None, None) not in done.get(model, [])):
+                chunks.append((model, [None]))
+            for i in range(0, len(ids), chunk_size):
+                chunks.append((model, ids[i:i + chunk_size]))
+    return chunks
+
+
+def _process(args):
+    '''
+    Recompute a chunk in its own transaction, run by the workers
+    '''
+    database, model, ids = args
+    functions = dict(MODELS)
+    start = time.time()
+    try:
+        with Transaction().start(database, 0):
+            functions[model](ids)
+            Transaction().cursor.commit()
+    except Exception:
+        logger.exception('%s: chunk %s-%s failed', model, ids[0], ids[-1])
+        return model, ids, None
+    return model, ids, time.time() - start
+
+
+def _load_state(path):
+    '''
+    Return the (first, last) id ranges already processed by model.
+    The ids being given in increasing order, the records created after the
+    interrupted run are not in these ranges.
+    '''
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path) as state_file:
+        state = json.load(state_file)
+    for model, first, last in state['done']:
+        done.setdefault(model, []).append((first, last))
+    return done
+
+
+def _save_state(path, done):
+    if not path:
+        return
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as state_file:
+        json.dump({
+                'done': [[m, f, l] for m, ranges in sorted(done.iteritems())
+                    for f, l in ranges],
+                }, state_file)
+    os.rename(temporary, path)
+
+
+def recompute(database, models=None, chunk_size=1000, processes=None,
+        state=None):
+    '''
+    Recompute the derived data of the models and return the number of failed
+    chunks.
+    The trytond configuration must be loaded.
+    '''
+    models = models or [m for m, _ in MODELS]
+    unknown = set(models) - set(m for m, _ in MODELS)
+    if unknown:
+        raise ValueError('No derived data for %s' % ', '.join(sorted(unknown)))
+    # Keep the order of MODELS
+    models = [m for m, _ in MODELS if m in models]
+
+    Pool.start()
+    done = _load_state(state)
+    chunks = _chunks(database, models, chunk_size, done)
+    logger.info('%s chunks to process, %s ranges already done', len(chunks),
+        sum(len(r) for r in done.itervalues()))
+    # The forked workers inherit the initialized pool but must open their
+    # own connections
+    backend.get('Database')(database).close()
+
+    failed = 0
+    count = 0
+    finished = 0
+    start = time.time()
+    workers = ProcessPool(processes)
+    try:
+        for model in models:
+            for model, ids, duration in workers.imap_unordered(_process,
+                    [(database, m, ids) for m, ids in chunks if m == model]):
+                if duration is None:
+                    failed += 1
+                    continue
+                done.setdefault(model, []).append((ids[0], ids[-1]))
+                _save_state(state, done)
+                count += len(ids)
+                finished += 1
+                logger.info('%s: ids %s-%s in %.2fs, %s/%s chunks, '
+                    '%.0f records/s', model, ids[0], ids[-1], duration,
+                    finished, len(chunks), count / (time.time() - start))
+            if failed:
+                # The next models may depend on the failed chunks
+                break
+        workers.close()
+    except KeyboardInterrupt:
+        workers.terminate()
+        raise
+    finally:
+        workers.join()
+    if failed:
+        logger.error('%s chunks failed, run again to resume', failed)
+    elif state and os.path.exists(state):
+        os.remove(state)
+    return failed
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        description='Recompute the derived training data')
+    parser.add_argument('-c', '--config', dest='config',
+        help='the trytond configuration file')
+    parser.add_argument('-d', '--database', dest='database', required=True)
+    parser.add_argument('-m', '--model', dest='models', action='append',
+        choices=[m for m, _ in MODELS],
+        help='the model to recompute, all by default')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+        default=1000)
+    parser.add_argument('-p', '--processes', dest='processes', type=int,
+        help='the number of workers, the number of CPU by default')
+    parser.add_argument('--state', dest='state',
+        help='the file recording the finished chunks to resume a run')
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s')
+    CONFIG.update_etc(options.config)
+    return 1 if recompute(options.database, options.models,
+        options.chunk_size, options.processes, options.state) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+'''
+Read-only access to the training records as tuples for the reports.
+The records are read by chunks of ids with plain SQL so no instance nor
+cache is built, the derived student and faculty fields are computed for the
+whole chunk at once.
+'''
+from collections import namedtuple
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from trytond.model import fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+
+from .replica import ReplicaError, read_cursor, fall_back
+
+__all__ = ['iter_rows', 'read_columns']
+
+# The fields of the person data read from party.party
+_PARTY_FIELDS = ['lastname', 'dob', 'sex', 'marital_status']
+# The fields read from the party contact mechanisms
+_CONTACT_FIELDS = ['phone', 'mobile', 'fax', 'email', 'website']
+# The suffix of the age as computed by the models
+_AGE_SUFFIX = {
+    'training.student': '',
+    'training.faculty': '.',
+    }
+
+
+def _age(dob, today, suffix):
+    if not dob:
+        return 'No DoB !'
+    delta = relativedelta(today, dob)
+    return '%sa %sm %sd%s' % (delta.years, delta.months, delta.days, suffix)
+
+
+def _person_values(cursor, model_name, party_ids, names):
+    '''
+    Return for each party id the values of the derived person fields
+    '''
+    pool = Pool()
+    Party = pool.get('party.party')
+    Mechanism = pool.get('party.contact_mechanism')
+    party = Party.__table__()
+    mechanism = Mechanism.__table__()
+
+    values = dict((p, {}) for p in party_ids)
+    party_names = [n for n in _PARTY_FIELDS if n in names]
+    if 'age' in names and 'dob' not in party_names:
+        party_names.append('dob')
+    if party_names:
+        cursor.execute(*party.select(party.id,
+                *[getattr(party, n) for n in party_names],
+                where=party.id.in_(party_ids)))
+        for row in cursor.fetchall():
+            values[row[0]].update(zip(party_names, row[1:]))
+    if 'age' in names:
+        today = date.today()
+        suffix = _AGE_SUFFIX.get(model_name, '')
+        for party_values in values.itervalues():
+            party_values['age'] = _age(party_values.get('dob'), today,
+                suffix)
+
+    contact_names = [n for n in _CONTACT_FIELDS if n in names]
+    if contact_names:
+        cursor.execute(*mechanism.select(mechanism.party, mechanism.type,
+                mechanism.value,
+                where=mechanism.party.in_(party_ids)
+                & mechanism.type.in_(contact_names)
+                & (mechanism.active == True),
+                order_by=[mechanism.sequence.desc, mechanism.id.desc]))
+        # The last row of each type wins, it is the first by sequence
+        for party_id, type_, value in cursor.fetchall():
+            values[party_id][type_] = value
+    return values
+
+
+def _chunks(model_name, domain, chunk_size):
+    '''
+    Yield the ids matching the domain by chunks, paginated on the id so the
+    memory stays bounded and the access rules are applied by the search
+    '''
+    Model = Pool().get(model_name)
+    last_id = 0
+    while True:
+        records = Model.search((domain or []) + [('id', '>', last_id)],
+            order=[('id', 'ASC')], limit=chunk_size)
+        if not records:
+            return
+        ids = [r.id for r in records]
+        yield ids
+        last_id = ids[-1]
+
+
+def iter_rows(model_name, field_names, domain=None, chunk_size=1000):
+    '''
+    Yield a namedtuple with the id and the fields for each record of the
+    model matching the domain.
+    The stored fields are read as their column value, Many2One as id, and
+    for students and faculties the person fields (lastname, dob, sex,
+    marital_status, age and contact mechanisms) are also available.
+    '''
+    pool = Pool()
+    Model = pool.get(model_name)
+    ModelAccess = pool.get('ir.model.access')
+    cursor = Transaction().cursor
+    table = Model.__table__()
+
+    ModelAccess.check(model_name, 'read')
+    person = model_name in _AGE_SUFFIX
+    derived = set(_PARTY_FIELDS + _CONTACT_FIELDS + ['age']) if person \
+        else set()
+    columns = []
+    for name in field_names:
+        if name in derived:
+            continue
+        field = Model._fields.get(name)
+        if (not field or isinstance(field, fields.Function)
+                or field._type in ('one2many', 'many2many')):
+            raise ValueError('Field "%s" of "%s" can not be read as a row'
+                % (name, model_name))
+        columns.append(name)
+    derived_names = [n for n in field_names if n in derived]
+    if derived_names and 'name' not in columns:
+        columns.append('name')
+
+    def read_chunk(read, ids):
+        read.execute(*table.select(table.id,
+                *[getattr(table, c) for c in columns],
+                where=table.id.in_(ids), order_by=table.id))
+        records = [dict(zip(['id'] + columns, r)) for r in read.fetchall()]
+        if derived_names:
+            persons = _person_values(read, model_name,
+                list(set(r['name'] for r in records if r['name'])),
+                derived_names)
+            for record in records:
+                record.update(persons.get(record['name'], {}))
+        return records
+
+    Row = namedtuple('Row', ['id'] + list(field_names))
+    chunk_size = min(chunk_size, cursor.IN_MAX)
+    # The ids are searched on the primary to apply the access rules
+    with read_cursor() as read:
+        for ids in _chunks(model_name, domain, chunk_size):
+            try:
+                records = read_chunk(read, ids)
+            except ReplicaError:
+                # Restart the chunk on the primary
+                read = fall_back(read)
+                records = read_chunk(read, ids)
+            for record in records:
+                yield Row(record['id'],
+                    *[record.get(n) for n in field_names])
+
+
+def read_columns(model_name, field_names, domain=None, chunk_size=1000):
+    '''
+    Return a dictionary with the list of values of each field, and the ids
+    '''
+    columns = dict((n, []) for n in ['id'] + list(field_names))
+    for row in iter_rows(model_name, field_names, domain=domain,
+            chunk_size=chunk_size):
+        for name, value in zip(row._fields, row):
+            columns[name].append(value)
+    return columns
@@ -0,0 +1,347 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import logging
+
+from sql.conditionals import Coalesce
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond.config import CONFIG
+from trytond import backend
+
+__all__ = ['TrainingRoom', 'TrainingCourseSession']
+
+logger = logging.getLogger(__name__)
+
+# Resources that can not be booked twice at the same time
+_RESOURCES = ['faculty', 'room']
+
+
+def find_overlaps(rows):
+    '''
+    Sweep over (resource, start, end, id) rows and return the pairs of ids
+    whose intervals overlap on the same resource.
+    Each conflicting session is reported at least once in O(n log n).
+    '''
+    overlaps = []
+    current = last_end = last_id = None
+    for resource, start, end, id_ in sorted(rows):
+        if resource != current:
+            current, last_end, last_id = resource, end, id_
+            continue
+        if start < last_end:
+            overlaps.append((last_id, id_))
+        if end > last_end:
+            last_end, last_id = end, id_
+    return overlaps
+
+
+class TrainingRoom(ModelSQL, ModelView):
+    'Training Room'
+    __name__ = 'training.room'
+
+    name = fields.Char('Name', required=True)
+    capacity = fields.Integer('Capacity')
+    active = fields.Boolean('Active', select=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingRoom, cls).__setup__()
+        cls._sql_constraints += [
+            ('name_uniq', 'UNIQUE(name)', 'The room must be unique.'),
+            ]
+
+    @staticmethod
+    def default_active():
+        return True
+
+
+class TrainingCourseSession(ModelSQL, ModelView):
+    'Training Course Session'
+    __name__ = 'training.course.session'
+
+    course = fields.Many2One('training.course', 'Course', required=True,
+        ondelete='CASCADE', select=True, on_change=['course', 'faculty'])
+    faculty = fields.Many2One('training.faculty', 'Faculty', select=True,
+        help="The faculty who give the session")
+    room = fields.Many2One('training.room', 'Room', select=True)
+    start_date = fields.DateTime('Start', required=True, select=True)
+    end_date = fields.DateTime('End', required=True, select=True)
+    number = fields.Integer('Number', readonly=True,
+        help="The position of the session in the attendance bitmaps")
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingCourseSession, cls).__setup__()
+        cls._sql_constraints += [
+            ('dates_check', 'CHECK(start_date < end_date)',
+                'The session must end after it starts.'),
+            ('course_number_uniq', 'UNIQUE(course, number)',
+                'The session number must be unique per course.'),
+            ]
+        cls._order.insert(0, ('start_date', 'ASC'))
+        cls._error_messages.update({
+                'faculty_overlap': ('The faculty of session "%s" is already '
+                    'booked by session "%s".'),
+                'room_overlap': ('The room of session "%s" is already '
+                    'booked by session "%s".'),
+                })
+
+    @classmethod
+    def __register__(cls, module_name):
+        super(TrainingCourseSession, cls).__register__(module_name)
+
+        if CONFIG['db_type'] != 'postgresql':
+            return
+        cursor = Transaction().cursor
+        cursor.execute("SELECT 1 FROM pg_extension "
+            "WHERE extname = 'btree_gist'")
+        if not cursor.fetchone():
+            logger.warning('btree_gist is not installed on the database, '
+                'session conflicts will be checked by the module')
+            return
+        for resource in _RESOURCES:
+            name = '%s_%s_excl' % (cls._table, resource)
+            cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s',
+                (name,))
+            if cursor.fetchone():
+                continue
+            cursor.execute('ALTER TABLE "%s" ADD CONSTRAINT "%s" '
+                'EXCLUDE USING gist ("%s" WITH =, '
+                'tsrange(start_date, end_date) WITH &&) '
+                'WHERE ("%s" IS NOT NULL)'
+                % (cls._table, name, resource, resource))
+
+    @classmethod
+    def _exclusion_constraints(cls):
+        '''
+        Return the resources already guarded by the database
+        '''
+        if CONFIG['db_type'] != 'postgresql':
+            return set()
+        cursor = Transaction().cursor
+        names = dict(('%s_%s_excl' % (cls._table, r), r) for r in _RESOURCES)
+        cursor.execute('SELECT conname FROM pg_constraint '
+            'WHERE conname IN (' + ','.join(['%s'] * len(names)) + ')',
+            tuple(names))
+        return set(names[name] for name, in cursor.fetchall())
+
+    def on_change_course(self):
+        if self.course and self.course.faculty and not self.faculty:
+            return {'faculty': self.course.faculty.id}
+        return {}
+
+    @classmethod
+    def create(cls, vlist):
+        Course = Pool().get('training.course')
+
+        vlist = [x.copy() for x in vlist]
+        counts = {}
+        for values in vlist:
+            if not values.get('faculty') and values.get('course'):
+                course = Course(values['course'])
+                if course.faculty:
+                    values['faculty'] = course.faculty.id
+            course = values.get('course')
+            if not values.get('number') and course:
+                counts[course] = counts.get(course, 0) + 1
+        numbers = cls.reserve_numbers(counts)
+        for values in vlist:
+            course = values.get('course')
+            if not values.get('number') and course:
+                numbers[course] += 1
+                values['number'] = numbers[course]
+
+        sessions, resource = cls._savepoint(
+            super(TrainingCourseSession, cls).create, vlist)
+        if resource:
+            cls._raise_overlap(resource, [(-i - 1,
+                        '%s @ %s' % (Course(v['course']).rec_name,
+                            v['start_date']),
+                        v.get(resource), v['start_date'], v['end_date'])
+                    for i, v in enumerate(vlist)])
+        return sessions
+
+    @classmethod
+    def reserve_numbers(cls, counts):
+        '''
+        Reserve the number of sessions of each course and return the last
+        number used before the reservation.
+        The number gives the bit of the session in the attendance bitmaps so
+        it is taken from a counter of the course and never reused. The update
+        locks the course row until the end of the transaction.
+        '''
+        Course = Pool().get('training.course')
+        cursor = Transaction().cursor
+        course = Course.__table__()
+
+        numbers = {}
+        for course_id, count in counts.iteritems():
+            cursor.execute(*course.update([course.last_session_number],
+                    [Coalesce(course.last_session_number, 0) + count],
+                    where=course.id == course_id))
+            cursor.execute(*course.select(course.last_session_number,
+                    where=course.id == course_id))
+            numbers[course_id] = cursor.fetchone()[0] - count
+        return numbers
+
+    @classmethod
+    def write(cls, sessions, vals):
+        Attendance = Pool().get('training.course.attendance')
+
+        args = [(sessions, vals)]
+        moved = [s for s in sessions
+            if 'course' in vals and s.course.id != vals['course']]
+        if moved:
+            # The bit of the session is cleared in the previous course and a
+            # new number is given in the new one
+            Attendance.clear_sessions(cls._numbers(moved))
+            number = cls.reserve_numbers(
+                {vals['course']: len(moved)})[vals['course']]
+            args = [([s for s in sessions if s not in moved], vals)]
+            for session in moved:
+                number += 1
+                values = vals.copy()
+                values['number'] = number
+                args.append(([session], values))
+
+        result = None
+        for records, values in args:
+            if not records:
+                continue
+            result, resource = cls._savepoint(
+                super(TrainingCourseSession, cls).write, records, values)
+            if resource:
+                candidates = []
+                for session in records:
+                    value = values.get(resource, getattr(session, resource))
+                    candidates.append((session.id, session.rec_name,
+                            getattr(value, 'id', value),
+                            values.get('start_date', session.start_date),
+                            values.get('end_date', session.end_date)))
+                cls._raise_overlap(resource, candidates)
+        return result
+
+    @classmethod
+    def delete(cls, sessions):
+        Attendance = Pool().get('training.course.attendance')
+
+        numbers = cls._numbers(sessions)
+        super(TrainingCourseSession, cls).delete(sessions)
+        Attendance.clear_sessions(numbers)
+
+    @staticmethod
+    def _numbers(sessions):
+        '''
+        Return the session numbers by course
+        '''
+        numbers = {}
+        for session in sessions:
+            if session.number:
+                numbers.setdefault(session.course.id, []).append(
+                    session.number)
+        return numbers
+
+    @classmethod
+    def _savepoint(cls, func, *args):
+        '''
+        Call func in a savepoint and return its result and the resource whose
+        exclusion constraint was violated, the savepoint is then rolled back
+        '''
+        DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
+        cursor = Transaction().cursor
+        guarded = cls._exclusion_constraints()
+        if not guarded:
+            return func(*args), None
+        cursor.execute('SAVEPOINT training_course_session')
+        try:
+            result = func(*args)
+        except DatabaseIntegrityError as exception:
+            for resource in guarded:
+                if '%s_%s_excl' % (cls._table, resource) in str(exception):
+                    break
+            else:
+                raise
+            cursor.execute('ROLLBACK TO SAVEPOINT training_course_session')
+            return None, resource
+        cursor.execute('RELEASE SAVEPOINT training_course_session')
+        return result, None
+
+    @classmethod
+    def _raise_overlap(cls, resource, candidates):
+        '''
+        Raise the overlap error of the resource for the first of the
+        (id, name, resource id, start, end) candidates conflicting with a
+        stored session or another candidate
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        column = getattr(table, resource)
+
+        names = dict((c[0], c[1]) for c in candidates)
+        rows = [(v, s, e, i) for i, _, v, s, e in candidates if v]
+        values = list(set(r[0] for r in rows))
+        start = min(r[1] for r in rows)
+        end = max(r[2] for r in rows)
+        for i in range(0, len(values), cursor.IN_MAX):
+            sub_values = values[i:i + cursor.IN_MAX]
+            cursor.execute(*table.select(column, table.start_date,
+                    table.end_date, table.id,
+                    where=column.in_(sub_values)
+                    & (table.start_date < end)
+                    & (table.end_date > start)))
+            rows.extend(r for r in cursor.fetchall() if r[3] not in names)
+        for first, second in find_overlaps(rows):
+            if first in names or second in names:
+                for id_ in (first, second):
+                    if id_ not in names:
+                        names[id_] = cls(id_).rec_name
+                cls.raise_user_error('%s_overlap' % resource,
+                    (names[second], names[first]))
+        cls.raise_user_error('%s_overlap' % resource,
+            (candidates[0][1], ''))
+
+    @classmethod
+    def validate(cls, sessions):
+        super(TrainingCourseSession, cls).validate(sessions)
+        cls.check_overlaps(sessions)
+
+    @classmethod
+    def check_overlaps(cls, sessions):
+        '''
+        Check that no faculty or room is booked twice at the same time.
+        Only the sessions sharing a resource within the time span of the
+        validated sessions are loaded, then swept in start order.
+        '''
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        guarded = cls._exclusion_constraints()
+        resources = [r for r in _RESOURCES if r not in guarded]
+        if not resources or not sessions:
+            return
+        ids = set(s.id for s in sessions)
+        start = min(s.start_date for s in sessions)
+        end = max(s.end_date for s in sessions)
+        for resource in resources:
+            values = list(set(getattr(s, resource).id for s in sessions
+                    if getattr(s, resource)))
+            column = getattr(table, resource)
+            rows = []
+            for i in range(0, len(values), cursor.IN_MAX):
+                sub_values = values[i:i + cursor.IN_MAX]
+                cursor.execute(*table.select(column, table.start_date,
+                        table.end_date, table.id,
+                        where=column.in_(sub_values)
+                        & (table.start_date < end)
+                        & (table.end_date > start)))
+                rows.extend(cursor.fetchall())
+            for first, second in find_overlaps(rows):
+                if first in ids or second in ids:
+                    first, second = cls.browse([first, second])
+                    cls.raise_user_error('%s_overlap' % resource,
+                        (second.rec_name, first.rec_name))
+
+    def get_rec_name(self, name):
+        return '%s @ %s' % (self.course.rec_name, self.start_date)
@@ -0,0 +1,462 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+
+import trytond.tests.test_tryton
+from trytond.tests.test_tryton import POOL, DB_NAME, USER, CONTEXT, \
+    test_view, test_depends
+from trytond.transaction import Transaction
+from trytond.exceptions import UserError
+from trytond.config import CONFIG
+
+from trytond.modules.training.session import find_overlaps
+from trytond.modules.training.attendance import popcount, set_bit, get_bit
+from trytond.modules.training.grading import build_matrix, compute_averages
+from trytond.modules.training import replica, rows
+
+
+class TrainingTestCase(unittest.TestCase):
+    'Test Training module'
+
+    def setUp(self):
+        trytond.tests.test_tryton.install_module('training')
+        self.party = POOL.get('party.party')
+        self.student = POOL.get('training.student')
+        self.course = POOL.get('training.course')
+        self.session = POOL.get('training.course.session')
+        self.attendance = POOL.get('training.course.attendance')
+        self.prerequisite = POOL.get('training.course.prerequisite')
+        self.closure = POOL.get('training.course.prerequisite.closure')
+        self.enrollment = POOL.get('training.course.enrollment')
+        self.user = POOL.get('res.user')
+        self.faculty = POOL.get('training.faculty')
+        self.workload = POOL.get('training.faculty.workload')
+
+    def test0005views(self):
+        'Test views'
+        test_view('training')
+
+    def test0006depends(self):
+        'Test depends'
+        test_depends()
+
+    def test0010session_numbers(self):
+        'Test the session numbers are not reused after a delete'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            party, = self.party.create([{
+                        'name': 'Student',
+                        'is_person': True,
+                        'is_student': True,
+                        }])
+            student, = self.student.create([{
+                        'name': party.id,
+                        'identification_code': 'S1',
+                        }])
+            course, = self.course.create([{
+                        'name': 'Course',
+                        'code': 'C1',
+                        }])
+            sessions = self.session.create([{
+                        'course': course.id,
+                        'start_date': datetime(2014, 1, day, 8),
+                        'end_date': datetime(2014, 1, day, 10),
+                        } for day in (1, 2, 3)])
+            self.assertEqual([s.number for s in sessions], [1, 2, 3])
+            self.attendance.mark(sessions, [student])
+            attendance, = self.attendance.search([
+                    ('course', '=', course.id),
+                    ])
+            self.assertEqual(attendance.attended, 3)
+
+            # The bit of the deleted session is cleared
+            self.session.delete([sessions[-1]])
+            values, = self.attendance.read([attendance.id],
+                ['attended', 'presence'])
+            self.assertEqual(values['attended'], 2)
+            self.assertFalse(get_bit(values['presence'], 2))
+
+            # The new session does not inherit the bit of the deleted one
+            session, = self.session.create([{
+                        'course': course.id,
+                        'start_date': datetime(2014, 1, 4, 8),
+                        'end_date': datetime(2014, 1, 4, 10),
+                        }])
+            self.assertEqual(session.number, 4)
+            values, = self.attendance.read([attendance.id], ['presence'])
+            self.assertFalse(get_bit(values['presence'], 3))
+            self.assertEqual(
+                self.attendance.session_counts([course.id])[course.id], 3)
+
+            transaction.cursor.rollback()
+
+    def closure_pairs(self):
+        'Return the pairs of the prerequisite closure'
+        return sorted((c.course.name, c.required.name)
+            for c in self.closure.search([]))
+
+    def test0020prerequisites(self):
+        'Test the prerequisite closure and the eligibility'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            first, second, third = self.course.create([{
+                        'name': name,
+                        'code': name,
+                        } for name in ('A', 'B', 'C')])
+            edges = self.prerequisite.create([{
+                        'course': second.id,
+                        'prerequisite': first.id,
+                        }, {
+                        'course': third.id,
+                        'prerequisite': second.id,
+                        }])
+            self.assertEqual(self.closure_pairs(),
+                [('B', 'A'), ('C', 'A'), ('C', 'B')])
+
+            # The cycles are rejected
+            self.assertRaises(UserError, self.prerequisite.create, [{
+                        'course': first.id,
+                        'prerequisite': third.id,
+                        }])
+            self.assertRaises(UserError, self.prerequisite.create, [{
+                        'course': first.id,
+                        'prerequisite': first.id,
+                        }])
+
+            parties = self.party.create([{
+                        'name': 'Student %s' % i,
+                        'is_person': True,
+                        'is_student': True,
+                        } for i in range(3)])
+            students = self.student.create([{
+                        'name': p.id,
+                        'identification_code': 'S%s' % i,
+                        } for i, p in enumerate(parties)])
+            self.enrollment.create([{
+                        'student': students[0].id,
+                        'course': first.id,
+                        'state': 'done',
+                        }, {
+                        'student': students[0].id,
+                        'course': second.id,
+                        'state': 'done',
+                        }, {
+                        'student': students[1].id,
+                        'course': first.id,
+                        'state': 'done',
+                        }])
+            self.assertEqual(self.course.get_eligibility(third, students),
+                {
+                    students[0].id: True,
+                    students[1].id: False,
+                    students[2].id: False,
+                    })
+            self.assertEqual(self.course.get_eligibility(first, students),
+                dict((s.id, True) for s in students))
+            self.enrollment.create([{
+                        'student': students[0].id,
+                        'course': third.id,
+                        }])
+            self.assertRaises(UserError, self.enrollment.create, [{
+                        'student': students[1].id,
+                        'course': third.id,
+                        }])
+
+            # The deleted edge is removed from the closure
+            self.prerequisite.delete([edges[0]])
+            self.assertEqual(self.closure_pairs(), [('C', 'B')])
+            self.assertEqual(self.course.get_eligibility(third, students),
+                {
+                    students[0].id: True,
+                    students[1].id: False,
+                    students[2].id: False,
+                    })
+
+            transaction.cursor.rollback()
+
+    def workload_rows(self):
+        'Return the faculty workload summary by key'
+        workloads = self.workload.search([])
+        return dict(((w['faculty'], w['category'], w['state']),
+                    (w['hours'], w['courses']))
+            for w in self.workload.read([w.id for w in workloads],
+                ['faculty', 'category', 'state', 'hours', 'courses']))
+
+    def test0030workload(self):
+        'Test the faculty workload follows the courses'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            users = self.user.create([{
+                        'name': 'Faculty %s' % i,
+                        'login': 'faculty%s' % i,
+                        } for i in range(2)])
+            parties = self.party.create([{
+                        'name': 'Faculty %s' % i,
+                        'is_person': True,
+                        'is_faculty': True,
+                        'internal_user': u.id,
+                        } for i, u in enumerate(users)])
+            first, second = self.faculty.create([{
+                        'name': p.id,
+                        'identification_code': 'F%s' % i,
+                        } for i, p in enumerate(parties)])
+            courses = self.course.create([{
+                        'name': 'Course %s' % i,
+                        'code': 'W%s' % i,
+                        'faculty': faculty.id,
+                        'duration': duration,
+                        } for i, (faculty, duration) in enumerate([
+                            (first, 10), (first, 20), (second, 5)])])
+            self.assertEqual(self.workload_rows(), {
+                    (first.id, None, 'draft'): (30, 2),
+                    (second.id, None, 'draft'): (5, 1),
+                    })
+
+            # Move a course to the other faculty
+            self.course.write([courses[1]], {'faculty': second.id})
+            self.assertEqual(self.workload_rows(), {
+                    (first.id, None, 'draft'): (10, 1),
+                    (second.id, None, 'draft'): (25, 2),
+                    })
+
+            # Move a course to another state, the empty key is removed
+            self.course.write([courses[0]], {'state': 'open'})
+            self.assertEqual(self.workload_rows(), {
+                    (first.id, None, 'open'): (10, 1),
+                    (second.id, None, 'draft'): (25, 2),
+                    })
+
+            # Change the faculty and the duration at once
+            self.course.write([courses[2]], {
+                    'faculty': first.id,
+                    'duration': 15,
+                    })
+            self.assertEqual(self.workload_rows(), {
+                    (first.id, None, 'open'): (10, 1),
+                    (first.id, None, 'draft'): (15, 1),
+                    (second.id, None, 'draft'): (20, 1),
+                    })
+
+            self.course.delete([courses[1]])
+            self.course.write([courses[2]], {'faculty': None})
+            expected = {
+                (first.id, None, 'open'): (10, 1),
+                (None, None, 'draft'): (15, 1),
+                }
+            self.assertEqual(self.workload_rows(), expected)
+
+            # The deltas match a rebuild from the courses
+            self.workload.rebuild()
+            self.assertEqual(self.workload_rows(), expected)
+
+            transaction.cursor.rollback()
+
+
+class FindOverlapsTestCase(unittest.TestCase):
+    'Test the session overlap sweep'
+
+    def test_no_overlap(self):
+        'Consecutive sessions do not overlap'
+        rows = [
+            (1, datetime(2014, 1, 1, 8), datetime(2014, 1, 1, 10), 1),
+            (1, datetime(2014, 1, 1, 10), datetime(2014, 1, 1, 12), 2),
+            ]
+        self.assertEqual(find_overlaps(rows), [])
+
+    def test_overlap(self):
+        'Overlapping sessions of the same resource'
+        rows = [
+            (1, datetime(2014, 1, 1, 9), datetime(2014, 1, 1, 11), 2),
+            (1, datetime(2014, 1, 1, 8), datetime(2014, 1, 1, 10), 1),
+            ]
+        self.assertEqual(find_overlaps(rows), [(1, 2)])
+
+    def test_other_resource(self):
+        'Sessions of different resources do not overlap'
+        rows = [
+            (1, datetime(2014, 1, 1, 8), datetime(2014, 1, 1, 10), 1),
+            (2, datetime(2014, 1, 1, 9), datetime(2014, 1, 1, 11), 2),
+            ]
+        self.assertEqual(find_overlaps(rows), [])
+
+    def test_long_session(self):
+        'A long session overlaps all the sessions it contains'
+        rows = [
+            (1, datetime(2014, 1, 1, 8), datetime(2014, 1, 1, 18), 1),
+            (1, datetime(2014, 1, 1, 9), datetime(2014, 1, 1, 10), 2),
+            (1, datetime(2014, 1, 1, 11), datetime(2014, 1, 1, 12), 3),
+            ]
+        self.assertEqual(find_overlaps(rows), [(1, 2), (1, 3)])
+
+
+class BitmapTestCase(unittest.TestCase):
+    'Test the attendance bitmaps'
+
+    def test_popcount(self):
+        'Count the bits set'
+        self.assertEqual(popcount(None), 0)
+        self.assertEqual(popcount(b''), 0)
+        self.assertEqual(popcount(b'\x03\x80'), 3)
+        self.assertEqual(popcount(b'\xff' * 4), 32)
+
+    def test_set_bit(self):
+        'Set and clear bits'
+        bitmap = set_bit(None, 9, True)
+        self.assertEqual(bytes(bitmap), b'\x00\x02')
+        bitmap = set_bit(bitmap, 0, True)
+        self.assertEqual(bytes(bitmap), b'\x01\x02')
+        self.assertTrue(get_bit(bitmap, 9))
+        self.assertFalse(get_bit(bitmap, 8))
+        self.assertFalse(get_bit(bitmap, 100))
+        bitmap = set_bit(bitmap, 9, False)
+        self.assertEqual(bytes(bitmap), b'\x01\x00')
+        self.assertEqual(popcount(bitmap), 1)
+
+    def test_clear_unset(self):
+        'Clearing a bit beyond the bitmap only extends it'
+        bitmap = set_bit(b'\x01', 15, False)
+        self.assertEqual(bytes(bitmap), b'\x01\x00')
+
+
+class GradingTestCase(unittest.TestCase):
+    'Test the result computation'
+
+    def test_offer_passed(self):
+        'The offer is passed only with every course passed'
+        grades = build_matrix([
+                (1, 1, 80), (1, 2, 70),
+                (2, 1, 90),
+                (3, 1, 80), (3, 2, 40),
+                ], [1, 2, 3], [1, 2])
+        averages, passed = compute_averages(grades, [1, 3], grades >= 60)
+        self.assertEqual(list(passed), [True, False, False])
+        self.assertAlmostEqual(averages[0], 72.5)
+        self.assertAlmostEqual(averages[1], 90)
+
+
+class LagCursor(object):
+    'Cursor answering the replica status query'
+
+    database_name = 'test'
+
+    def __init__(self, recovery, lag):
+        self.row = (recovery, lag)
+
+    def execute(self, query):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class FailingCursor(object):
+    'Replica cursor whose connection is lost'
+
+    def execute(self, query, params=None):
+        raise replica.ReplicaError('connection lost')
+
+
+class ReplicaTestCase(unittest.TestCase):
+    'Test the replica routing'
+
+    def setUp(self):
+        trytond.tests.test_tryton.install_module('training')
+        self.party = POOL.get('party.party')
+        self.student = POOL.get('training.student')
+
+    def tearDown(self):
+        replica._status.clear()
+
+    def test_lag(self):
+        'A server which is not a standby is used only for the tests'
+        testing = CONFIG.get('training_replica_testing')
+        try:
+            CONFIG['training_replica_testing'] = False
+            self.assertEqual(replica._lag(LagCursor(True, 5.0)), 5.0)
+            self.assertEqual(replica._lag(LagCursor(False, None)), None)
+            CONFIG['training_replica_testing'] = True
+            self.assertEqual(replica._lag(LagCursor(False, None)), 0)
+        finally:
+            CONFIG['training_replica_testing'] = testing
+
+    def test_no_replica(self):
+        'The primary is used without replica'
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            with replica.read_cursor() as read:
+                self.assertTrue(read is Transaction().cursor)
+
+    def test_fall_back(self):
+        'The queries failing on the replica run again on the primary'
+        with Transaction().start(DB_NAME, USER,
+                context=CONTEXT) as transaction:
+            party, = self.party.create([{
+                        'name': 'Student',
+                        'is_person': True,
+                        'is_student': True,
+                        }])
+            student, = self.student.create([{
+                        'name': party.id,
+                        'identification_code': 'R1',
+                        }])
+
+            # An error on the primary is raised
+            try:
+                raise replica.ReplicaError('primary')
+            except replica.ReplicaError:
+                self.assertRaises(replica.ReplicaError, replica.fall_back,
+                    transaction.cursor)
+
+            @contextmanager
+            def failing_cursor():
+                yield FailingCursor()
+            read_cursor, rows.read_cursor = rows.read_cursor, failing_cursor
+            try:
+                result = list(rows.iter_rows('training.student',
+                        ['identification_code', 'lastname']))
+            finally:
+                rows.read_cursor = read_cursor
+            self.assertEqual([tuple(r) for r in result],
+                [(student.id, 'R1', None)])
+            self.assertEqual(
+                replica._usable(transaction.cursor.database_name), False)
+
+            transaction.cursor.rollback()
+
+    @unittest.skipUnless(CONFIG['db_type'] == 'postgresql'
+        and CONFIG.get('training_replica_uri'),
+        'training_replica_uri is not set on PostgreSQL')
+    def test_replica(self):
+        'The read-only transactions read from the replica'
+        with Transaction().start(DB_NAME, USER, context=CONTEXT):
+            with replica.read_cursor() as read:
+                self.assertTrue(read is Transaction().cursor)
+        with Transaction().start(DB_NAME, USER, readonly=True,
+                context=CONTEXT):
+            with replica.read_cursor() as read:
+                self.assertTrue(read is not Transaction().cursor)
+                self.assertTrue(read.training_replica)
+                read.execute('SELECT 1')
+                self.assertEqual(read.fetchone(), (1,))
+            with Transaction().set_context(training_primary=True):
+                with replica.read_cursor() as read:
+                    self.assertTrue(read is Transaction().cursor)
+
+
+def suite():
+    suite = trytond.tests.test_tryton.suite()
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            TrainingTestCase))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            FindOverlapsTestCase))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            BitmapTestCase))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            GradingTestCase))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(
+            ReplicaTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(suite())
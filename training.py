@@ -1,8 +1,16 @@
 #This file is part of Tryton.  The COPYRIGHT file at the top level of
 #this repository contains the full copyright notices and license terms.
+from sql import Table
+from sql.aggregate import Count, Max
+
 from trytond.model import Workflow, ModelView, ModelSQL, fields
 from trytond.pyson import Eval, Id
+from trytond.transaction import Transaction
 from trytond.pool import Pool
+from trytond import backend
+
+from .changelog import ChangeLogMixin
+from .replica import ReplicaMixin
 
 STATE = [('draft', 'Draft'),
          ('open', 'Opened'),
@@ -50,7 +58,8 @@ class TrainingCourseType(ModelView, ModelSQL):
     def default_active():
         return True
 
-class TrainingCourse(Workflow, ModelView, ModelSQL):
+class TrainingCourse(ChangeLogMixin, ReplicaMixin, Workflow, ModelView,
+        ModelSQL):
     'Training Course'
     __name__ = 'training.course'
 
@@ -68,6 +77,20 @@ class TrainingCourse(Workflow, ModelView, ModelSQL):
                                        "Sub Courses",
                                        states=STATES,
                                        help="A course can be completed with some sub courses")
+    sessions = fields.One2Many('training.course.session', 'course',
+        'Sessions')
+    last_session_number = fields.Integer('Last Session Number',
+        readonly=True,
+        help="The highest number given to a session, never given again")
+    prerequisites = fields.Many2Many('training.course.prerequisite',
+        'course', 'prerequisite', 'Prerequisites',
+        help="The courses a student must complete before enrolling")
+    enrollments = fields.One2Many('training.course.enrollment', 'course',
+        'Enrollments')
+    evaluations = fields.One2Many('training.course.evaluation', 'course',
+        'Evaluations', states=STATES)
+    pass_grade = fields.Float('Pass Grade', digits=(16, 2), states=STATES,
+        help="The minimum final grade to pass the course")
     code = fields.Char('Code', readonly=True)
     type = fields.Many2One('training.course.type', 'Type',
                                   states=STATES,)
@@ -90,7 +113,30 @@ class TrainingCourse(Workflow, ModelView, ModelSQL):
     @staticmethod
     def default_duration():
         return 2
+
+    @staticmethod
+    def default_pass_grade():
+        return 60.0
     
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        migrate = (TableHandler.table_exist(cursor, cls._table)
+            and not TableHandler(cursor, cls, module_name).column_exist(
+                'last_session_number'))
+
+        super(TrainingCourse, cls).__register__(module_name)
+
+        # Migration: the session numbers were computed from the sessions
+        if migrate and TableHandler.table_exist(cursor,
+                'training_course_session'):
+            table = cls.__table__()
+            session = Table('training_course_session')
+            cursor.execute(*table.update([table.last_session_number],
+                    [session.select(Max(session.number),
+                            where=session.course == table.id)]))
+
     @classmethod
     def __setup__(cls):
         super(TrainingCourse, cls).__setup__()
@@ -136,7 +182,33 @@ class TrainingCourse(Workflow, ModelView, ModelSQL):
                 values['code'] = Sequence.get_id(
                     config.course_sequence.id)
 
-        return super(TrainingCourse, cls).create(vlist)
+        courses = super(TrainingCourse, cls).create(vlist)
+
+        Workload = Pool().get('training.faculty.workload')
+        Workload.apply_deltas({},
+            Workload.course_values([c.id for c in courses]))
+        return courses
+
+    @classmethod
+    def write(cls, courses, vals):
+        Workload = Pool().get('training.faculty.workload')
+
+        # Keep the faculty workload summary in sync with the courses
+        if not Workload._course_fields & set(vals):
+            return super(TrainingCourse, cls).write(courses, vals)
+        ids = [c.id for c in courses]
+        old = Workload.course_values(ids)
+        result = super(TrainingCourse, cls).write(courses, vals)
+        Workload.apply_deltas(old, Workload.course_values(ids))
+        return result
+
+    @classmethod
+    def delete(cls, courses):
+        Workload = Pool().get('training.faculty.workload')
+
+        old = Workload.course_values([c.id for c in courses])
+        super(TrainingCourse, cls).delete(courses)
+        Workload.apply_deltas(old, {})
 
     @classmethod
     def validate(cls, courses):
@@ -149,6 +221,44 @@ class TrainingCourse(Workflow, ModelView, ModelSQL):
         if SEPARATOR in self.name:
             self.raise_user_error('wrong_name', (self.name,))
 
+    @classmethod
+    def get_eligibility(cls, course, students):
+        '''
+        Return a dictionary with True for the students that have completed
+        all the prerequisites of the course, direct or not.
+        The stored closure is joined with the enrollments so the whole batch
+        of students is evaluated at once.
+        '''
+        pool = Pool()
+        Closure = pool.get('training.course.prerequisite.closure')
+        Enrollment = pool.get('training.course.enrollment')
+        cursor = Transaction().cursor
+        closure = Closure.__table__()
+        enrollment = Enrollment.__table__()
+
+        cursor.execute(*closure.select(Count(closure.required),
+                where=closure.course == course.id))
+        required, = cursor.fetchone()
+        result = dict((s.id, not required) for s in students)
+        if not required:
+            return result
+
+        student_ids = list(result)
+        query = enrollment.join(closure,
+            condition=enrollment.course == closure.required)
+        for i in range(0, len(student_ids), cursor.IN_MAX):
+            sub_ids = student_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*query.select(enrollment.student,
+                    where=(closure.course == course.id)
+                    & (enrollment.state == 'done')
+                    & enrollment.student.in_(sub_ids),
+                    group_by=enrollment.student,
+                    having=Count(enrollment.course)
+                    >= required))
+            for student_id, in cursor.fetchall():
+                result[student_id] = True
+        return result
+
     def get_rec_name(self, name):
         if self.parent:
             return self.parent.get_rec_name(name) + SEPARATOR + self.name
@@ -206,9 +316,14 @@ class TrainingCourse(Workflow, ModelView, ModelSQL):
     @ModelView.button
     @Workflow.transition('done')
     def done(cls, records):
-        pass
+        pool = Pool()
+        Evaluation = pool.get('training.course.evaluation')
+        Certificate = pool.get('training.certificate')
+        Evaluation.compute_results(records)
+        Certificate.create_for_courses(records)
 
-class TrainingOffer(Workflow, ModelView, ModelSQL):
+class TrainingOffer(ChangeLogMixin, ReplicaMixin, Workflow, ModelView,
+        ModelSQL):
     'Training Offer'
     __name__ = 'training.offer'
     
@@ -236,6 +351,8 @@ class TrainingOffer(Workflow, ModelView, ModelSQL):
                                     help="Allows to write the requeriments of the offer")
     state = fields.Selection(STATE,
                               'State', required=True, readonly=True)
+    results = fields.One2Many('training.offer.result', 'offer', 'Results',
+        readonly=True)
 
     @classmethod
     def __setup__(cls):
@@ -325,7 +442,11 @@ class TrainingOffer(Workflow, ModelView, ModelSQL):
     @ModelView.button
     @Workflow.transition('done')
     def done(cls, records):
-        pass
+        pool = Pool()
+        Result = pool.get('training.offer.result')
+        Certificate = pool.get('training.certificate')
+        Result.compute_results(records)
+        Certificate.create_for_offers(records)
     
     def get_rec_name(self, name):
         if self.name:
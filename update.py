@@ -0,0 +1,172 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+'''
+Update the training module of databases only when its files changed.
+The digests of the Python, XML and configuration files of the module are
+stored in each database after an update, the databases whose digests match
+the current files are skipped instead of reloading all the XML data:
+
+    python -m trytond.modules.training.update -c trytond.conf \\
+        -d db1 -d db2 [--force]
+
+A report gives the duration of the check or of the update per database.
+'''
+import hashlib
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+from sql import Table
+
+from trytond.version import VERSION
+from trytond.model import ModelSQL, fields
+from trytond.config import CONFIG
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond import backend
+
+__all__ = ['TrainingModuleFingerprint', 'fingerprints', 'update']
+
+logger = logging.getLogger(__name__)
+
+MODULE = 'training'
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# The files loaded by an update
+_EXTENSIONS = ('.py', '.xml', '.cfg', '.po')
+_SKIPPED_DIRECTORIES = ('benchmarks', 'tests')
+
+
+class TrainingModuleFingerprint(ModelSQL):
+    'Training Module Fingerprint'
+    __name__ = 'training.module.fingerprint'
+
+    name = fields.Char('File', required=True, readonly=True, select=True)
+    digest = fields.Char('Digest', required=True, readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(TrainingModuleFingerprint, cls).__setup__()
+        cls._sql_constraints += [
+            ('name_uniq', 'UNIQUE(name)', 'The file must be unique.'),
+            ]
+
+    @classmethod
+    def store(cls, digests):
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        cursor.execute(*table.delete())
+        cursor.execute(*table.insert([table.name, table.digest],
+                [[n, d] for n, d in sorted(digests.iteritems())]))
+
+
+def fingerprints():
+    '''
+    Return the digest of each file of the module by relative path, and the
+    version of trytond as its upgrade reloads the modules too
+    '''
+    digests = {
+        'trytond': VERSION,
+        }
+    for root, dirs, files in os.walk(DIRECTORY):
+        dirs[:] = [d for d in dirs
+            if not d.startswith('.') and d not in _SKIPPED_DIRECTORIES]
+        for name in files:
+            if os.path.splitext(name)[1] not in _EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as fp:
+                digests[os.path.relpath(path, DIRECTORY)] = \
+                    hashlib.sha1(fp.read()).hexdigest()
+    return digests
+
+
+def _stored_fingerprints(database):
+    '''
+    Return the digests stored in the database, None if the module is not
+    installed
+    '''
+    TableHandler = backend.get('TableHandler')
+    module = Table('ir_module_module')
+    # The pool is not initialized yet
+    table_name = TrainingModuleFingerprint.__name__.replace('.', '_')
+    table = Table(table_name)
+
+    with Transaction().start(database, 0):
+        cursor = Transaction().cursor
+        cursor.execute(*module.select(module.state,
+                where=module.name == MODULE))
+        row = cursor.fetchone()
+        if not row or row[0] != 'installed':
+            return None
+        if not TableHandler.table_exist(cursor, table_name):
+            return {}
+        cursor.execute(*table.select(table.name, table.digest))
+        return dict(cursor.fetchall())
+
+
+def update(database, force=False):
+    '''
+    Update the module on the database if its files changed and return the
+    list of changed files, None if the update was skipped
+    '''
+    current = fingerprints()
+    stored = _stored_fingerprints(database)
+    if stored is None:
+        logger.warning('%s: module %s is not installed', database, MODULE)
+        return None
+    changed = sorted(n for n in set(current) | set(stored)
+        if current.get(n) != stored.get(n))
+    if not changed and not force:
+        return None
+
+    CONFIG['update'][MODULE] = 1
+    try:
+        Pool(database).init(update=True)
+    finally:
+        del CONFIG['update'][MODULE]
+    with Transaction().start(database, 0):
+        Pool().get('training.module.fingerprint').store(current)
+        Transaction().cursor.commit()
+    return changed
+
+
+def main(argv=None):
+    parser = ArgumentParser(
+        description='Update the training module of the changed databases')
+    parser.add_argument('-c', '--config', dest='config',
+        help='the trytond configuration file')
+    parser.add_argument('-d', '--database', dest='databases',
+        action='append', required=True)
+    parser.add_argument('--force', dest='force', action='store_true',
+        help='update even if no file changed')
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s')
+    CONFIG.update_etc(options.config)
+    Pool.start()
+
+    report = []
+    for database in options.databases:
+        start = time.time()
+        changed = update(database, force=options.force)
+        duration = time.time() - start
+        if changed is None:
+            status = 'skipped'
+        else:
+            status = 'updated (%s changed files)' % len(changed)
+            for name in changed:
+                logger.info('%s: %s changed', database, name)
+        report.append((database, status, duration))
+
+    width = max(len(d) for d, _, _ in report)
+    for database, status, duration in report:
+        print('%s  %8.2fs  %s' % (database.ljust(width), duration, status))
+    print('%s  %8.2fs' % ('total'.ljust(width),
+            sum(d for _, _, d in report)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
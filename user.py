@@ -0,0 +1,19 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.pool import Pool
+
+__all__ = ['User']
+
+
+class User(ModelSQL, ModelView):
+    __name__ = 'res.user'
+
+    training_faculty = fields.Function(fields.Many2One('training.faculty',
+            'Faculty', help="The faculty whose party has the user as "
+            "internal user"),
+        'get_training_faculty')
+
+    def get_training_faculty(self, name):
+        Faculty = Pool().get('training.faculty')
+        return Faculty.user_faculty(self.id)
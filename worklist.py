@@ -0,0 +1,124 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from sql import Null
+from sql.aggregate import Max
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond import backend
+
+__all__ = ['PartyCallWorklist']
+
+# The note type that requires to call back the party
+CALL_NOTE_TYPE = 'Llamar'
+
+
+class PartyCallWorklist(ModelSQL, ModelView):
+    'Party Call Worklist'
+    __name__ = 'party.call.worklist'
+
+    party = fields.Many2One('party.party', 'Party', required=True,
+        readonly=True, ondelete='CASCADE', select=True)
+    note = fields.Many2One('party.notes', 'Note', required=True,
+        readonly=True, ondelete='CASCADE')
+    date = fields.Date('Date', readonly=True, select=True)
+    value = fields.Char('Value', readonly=True)
+    user = fields.Many2One('res.user', 'Assigned to', select=True,
+        help="The staff member who calls the party back")
+
+    @classmethod
+    def __setup__(cls):
+        super(PartyCallWorklist, cls).__setup__()
+        cls._sql_constraints += [
+            ('party_uniq', 'UNIQUE(party)',
+                'The party is already in the call worklist.'),
+            ]
+        cls._order.insert(0, ('date', 'ASC'))
+        cls._buttons.update({
+                'assign_to_me': {},
+                })
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        created = not TableHandler.table_exist(cursor, cls._table)
+
+        super(PartyCallWorklist, cls).__register__(module_name)
+
+        if created:
+            cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        '''
+        Refresh the worklist for every party with notes, called by the
+        scheduler to recover from any missed update
+        '''
+        Note = Pool().get('party.notes')
+        cursor = Transaction().cursor
+        note = Note.__table__()
+        table = cls.__table__()
+
+        cursor.execute(*note.select(note.party, where=note.party != Null,
+                group_by=note.party))
+        party_ids = set(p for p, in cursor.fetchall())
+        cursor.execute(*table.select(table.party))
+        party_ids.update(p for p, in cursor.fetchall())
+        cls.refresh(party_ids)
+
+    @classmethod
+    def refresh(cls, party_ids):
+        '''
+        Put the parties whose latest note requires a call in the worklist and
+        remove the others, keeping the assigned user
+        '''
+        Note = Pool().get('party.notes')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        note = Note.__table__()
+
+        party_ids = list(set(filter(None, party_ids)))
+        calls = {}
+        for i in range(0, len(party_ids), cursor.IN_MAX):
+            sub_ids = party_ids[i:i + cursor.IN_MAX]
+            latest = note.select(Max(note.id), where=note.party.in_(sub_ids),
+                group_by=note.party)
+            cursor.execute(*note.select(note.party, note.id, note.date,
+                    note.value,
+                    where=note.id.in_(latest)
+                    & (note.note_type == CALL_NOTE_TYPE)))
+            for party, note_id, date, value in cursor.fetchall():
+                calls[party] = (note_id, date, value)
+
+        for i in range(0, len(party_ids), cursor.IN_MAX):
+            sub_ids = party_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*table.select(table.party,
+                    where=table.party.in_(sub_ids)))
+            existing = set(p for p, in cursor.fetchall())
+            removed = [p for p in sub_ids if p in existing and p not in calls]
+            if removed:
+                cursor.execute(*table.delete(
+                        where=table.party.in_(removed)))
+            for party in sub_ids:
+                if party not in calls:
+                    continue
+                note_id, date, value = calls[party]
+                if party in existing:
+                    cursor.execute(*table.update(
+                            [table.note, table.date, table.value],
+                            [note_id, date, value],
+                            where=table.party == party))
+                else:
+                    cursor.execute(*table.insert(
+                            [table.party, table.note, table.date,
+                                table.value],
+                            [[party, note_id, date, value]]))
+
+    @classmethod
+    @ModelView.button
+    def assign_to_me(cls, worklists):
+        cls.write(worklists, {
+                'user': Transaction().user,
+                })
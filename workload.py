@@ -0,0 +1,187 @@
+#This file is part of Tryton.  The COPYRIGHT file at the top level of
+#this repository contains the full copyright notices and license terms.
+from sql import Null
+from sql.aggregate import Count, Sum
+from sql.conditionals import Coalesce
+
+from trytond.model import ModelView, ModelSQL, fields
+from trytond.transaction import Transaction
+from trytond.pool import Pool
+from trytond.config import CONFIG
+from trytond import backend
+
+from .training import STATE
+from .replica import ReplicaMixin
+
+__all__ = ['FacultyWorkload']
+
+
+class FacultyWorkload(ReplicaMixin, ModelSQL, ModelView):
+    'Faculty Workload'
+    __name__ = 'training.faculty.workload'
+
+    faculty = fields.Many2One('training.faculty', 'Faculty', readonly=True,
+        select=True)
+    category = fields.Many2One('training.course.category',
+        'Course Category', readonly=True, select=True)
+    state = fields.Selection(STATE, 'State', readonly=True, select=True)
+    hours = fields.Integer('Hours', readonly=True)
+    courses = fields.Integer('Courses', readonly=True)
+
+    # Fields of training.course that change the summary
+    _course_fields = set(['faculty', 'category', 'state', 'duration'])
+
+    @classmethod
+    def __setup__(cls):
+        super(FacultyWorkload, cls).__setup__()
+        cls._order.insert(0, ('faculty', 'ASC'))
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+        created = not TableHandler.table_exist(cursor, cls._table)
+
+        super(FacultyWorkload, cls).__register__(module_name)
+
+        # Fill the summary for the courses created before the module update
+        if created:
+            cls.rebuild()
+
+        # One row per key, the empty faculty and category are coalesced as
+        # NULL values are distinct for a UNIQUE constraint
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS '
+            '"%s_key_uniq" ON "%s" (COALESCE(faculty, 0), '
+            'COALESCE(category, 0), state)' % (cls._table, cls._table))
+
+    @classmethod
+    def rebuild(cls):
+        '''
+        Recompute the whole summary from the course table
+        '''
+        pool = Pool()
+        Course = pool.get('training.course')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        course = Course.__table__()
+
+        cursor.lock(cls._table)
+        cursor.execute(*table.delete())
+        cursor.execute(*table.insert(
+                [table.faculty, table.category, table.state, table.hours,
+                    table.courses],
+                course.select(course.faculty, course.category, course.state,
+                    Sum(Coalesce(course.duration, 0)), Count(course.id),
+                    group_by=[course.faculty, course.category,
+                        course.state])))
+
+    @classmethod
+    def rebuild_faculties(cls, faculty_ids):
+        '''
+        Recompute the summary of the faculties, None stands for the courses
+        without faculty
+        '''
+        pool = Pool()
+        Course = pool.get('training.course')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        course = Course.__table__()
+
+        ids = [i for i in faculty_ids if i is not None]
+        conditions = []
+        if ids:
+            conditions.append((table.faculty.in_(ids),
+                    course.faculty.in_(ids)))
+        if None in faculty_ids:
+            conditions.append((table.faculty == Null, course.faculty == Null))
+        for table_where, course_where in conditions:
+            cursor.execute(*table.delete(where=table_where))
+            cursor.execute(*table.insert(
+                    [table.faculty, table.category, table.state,
+                        table.hours, table.courses],
+                    course.select(course.faculty, course.category,
+                        course.state, Sum(Coalesce(course.duration, 0)),
+                        Count(course.id),
+                        where=course_where,
+                        group_by=[course.faculty, course.category,
+                            course.state])))
+
+    @classmethod
+    def course_values(cls, course_ids):
+        '''
+        Return the summary deltas of the courses as stored in the database
+        '''
+        pool = Pool()
+        Course = pool.get('training.course')
+        cursor = Transaction().cursor
+        course = Course.__table__()
+
+        deltas = {}
+        for i in range(0, len(course_ids), cursor.IN_MAX):
+            sub_ids = course_ids[i:i + cursor.IN_MAX]
+            cursor.execute(*course.select(course.faculty, course.category,
+                    course.state, course.duration,
+                    where=course.id.in_(sub_ids)))
+            for faculty, category, state, duration in cursor.fetchall():
+                key = (faculty, category, state)
+                hours, count = deltas.get(key, (0, 0))
+                deltas[key] = (hours + (duration or 0), count + 1)
+        return deltas
+
+    @classmethod
+    def apply_deltas(cls, old, new):
+        '''
+        Remove the old course values from the summary and add the new ones
+        '''
+        DatabaseIntegrityError = backend.get('DatabaseIntegrityError')
+        DatabaseOperationalError = backend.get('DatabaseOperationalError')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        deltas = {}
+        for values, sign in ((old, -1), (new, 1)):
+            for key, (hours, count) in values.iteritems():
+                dhours, dcount = deltas.get(key, (0, 0))
+                deltas[key] = (dhours + sign * hours, dcount + sign * count)
+        deltas = dict((k, v) for k, v in deltas.iteritems() if v != (0, 0))
+        if not deltas:
+            return
+
+        # No table lock so the course writes are not serialized, a concurrent
+        # insert of the same key is retried as an update or, when the row is
+        # not in the snapshot of the transaction, by the dispatcher
+        for (faculty, category, state), (hours, count) in deltas.iteritems():
+            where = table.state == state
+            for column, value in ((table.faculty, faculty),
+                    (table.category, category)):
+                if value is None:
+                    where &= column == Null
+                else:
+                    where &= column == value
+            update = table.update([table.hours, table.courses],
+                [table.hours + hours, table.courses + count], where=where)
+            cursor.execute(*update)
+            if cursor.rowcount:
+                continue
+            insert = table.insert(
+                [table.faculty, table.category, table.state,
+                    table.hours, table.courses],
+                [[faculty, category, state, hours, count]])
+            if CONFIG['db_type'] != 'postgresql':
+                # The other backends serialize the writing transactions
+                cursor.execute(*insert)
+                continue
+            cursor.execute('SAVEPOINT training_faculty_workload')
+            try:
+                cursor.execute(*insert)
+            except DatabaseIntegrityError:
+                cursor.execute('ROLLBACK TO SAVEPOINT '
+                    'training_faculty_workload')
+                cursor.execute(*update)
+                if not cursor.rowcount:
+                    # Inserted by a transaction committed after the start
+                    # of this one
+                    raise DatabaseOperationalError(
+                        'Concurrent insert of the faculty workload')
+            cursor.execute('RELEASE SAVEPOINT training_faculty_workload')
+        cursor.execute(*table.delete(where=table.courses <= 0))